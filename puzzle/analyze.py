@@ -0,0 +1,204 @@
+"""difficulty statistics and structural checks of a level pack, without pygame
+
+usage: python -m puzzle.analyze LEVEL_FILE [--output FILE] [--workers N]
+                                [--timeout SECONDS] [--max-nodes N] [--resume]
+
+every level of the file gets its number among the levels the game, replay and the
+solvers accept (empty for a level they skip) and among all levels of the file, its size, box and goal counts, inside floor, dead square ratio, the area the player
+reaches at the start and the length and time of a push-optimal solution. levels with
+unreachable boxes or goals, more goals than reachable boxes or a floor open to the
+border are reported as invalid and not solved. results are written as soon as they
+are ready, as CSV if the output file ends with .csv and as JSON lines otherwise, so
+--resume can skip the levels an interrupted run already wrote."""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from puzzle.levels import LevelReader
+from puzzle.levels.level import Map
+from puzzle.solver import Solver
+
+FIELDS = ("level", "file level", "result", "problems", "width", "height", "boxes", "goals", "floor",
+          "dead squares", "dead ratio", "reachable", "moves", "pushes", "nodes", "seconds")
+SETTINGS = {"timeout": None, "max nodes": 250000}  # solver limits of this process
+
+
+def configure(timeout, max_nodes):
+    """sets the solver limits of this process"""
+    SETTINGS["timeout"] = timeout
+    SETTINGS["max nodes"] = max_nodes
+
+
+def find_problems(level_map, lines):
+    """structural problems of a level's classified map and raw lines; a box already on
+    a goal counts for neither when it is walled in"""
+    problems = []
+    boxes, goals = [], []
+    for x_value, line in enumerate(lines):
+        for y_value, element in enumerate(line):
+            if element == '*' and level_map.get_tile((x_value, y_value)) != 'o':
+                continue
+            if element in ('$', '*'):
+                boxes.append((x_value, y_value))
+            if element in ('.', '+', '*'):
+                goals.append((x_value, y_value))
+    inside = [position for position in boxes if level_map.get_tile(position) == 'o']
+    if len(inside) < len(boxes):
+        problems.append("unreachable boxes")
+    if any(level_map.get_tile(position) != 'o' for position in goals):
+        problems.append("unreachable goals")
+    if len(goals) > len(inside):
+        problems.append("more goals than reachable boxes")
+    last_x, last_y = level_map.width - 1, level_map.height - 1
+    if any(level_map.get_tile((x_value, y_value)) == 'o'
+           for x_value in range(level_map.width) for y_value in range(level_map.height)
+           if x_value in (0, last_x) or y_value in (0, last_y)):
+        problems.append("open border")
+    return problems
+
+
+def analyze(task):
+    """statistics of one level, given as (number, number in the file, lines); the number
+    counts the levels the reader accepts and is None for the others"""
+    number, file_number, lines = task
+    players = sum(line.count('@') + line.count('+') for line in lines)
+    result = {"level": number,
+              "file level": file_number,
+              "boxes": sum(line.count('$') + line.count('*') for line in lines),
+              "goals": sum(line.count('.') + line.count('+') + line.count('*') for line in lines)}
+    if players != 1:
+        result["result"] = "invalid"
+        result["problems"] = "no player" if players == 0 else "more than one player"
+        return result
+
+    grid = LevelReader.pad_lines(lines)
+    start = [(x_value, row.index(element)) for x_value, row in enumerate(grid)
+             for element in ('@', '+') if element in row][0]
+    level_map = Map(grid, start)
+    floor = [(x_value, y_value) for x_value in range(level_map.width)
+             for y_value in range(level_map.height)
+             if level_map.get_tile((x_value, y_value)) == 'o']
+    problems = find_problems(level_map, lines)
+    result.update({"width": level_map.width,
+                   "height": level_map.height,
+                   "floor": len(floor),
+                   "problems": "; ".join(problems)})
+    board = None if problems else LevelReader().build_board(lines)
+    if board is None:
+        result["result"] = "invalid"
+        return result
+
+    dead = sum(1 for position in floor if board.map_grid.is_dead_square(position))
+    result.update({"dead squares": dead,
+                   "dead ratio": round(float(dead) / len(floor), 4),
+                   "reachable": len(board.reachable_area())})
+    started = time.time()
+    solver = Solver(board, SETTINGS["max nodes"], SETTINGS["timeout"])
+    solution = solver.solve()
+    result["seconds"] = round(time.time() - started, 4)
+    result["nodes"] = solver.nodes
+    if solution is not None:
+        result.update({"result": "solved",
+                       "moves": len(solution),
+                       "pushes": sum(1 for letter in solution if letter.isupper())})
+    elif solver.limit_reached == "time":
+        result["result"] = "timeout"
+    elif solver.limit_reached == "nodes":
+        result["result"] = "node limit"
+    else:
+        result["result"] = "unsolvable"
+    return result
+
+
+def finished_levels(output_file):
+    """file numbers of the levels an earlier run already wrote to the output file; an
+    unfinished last line, as an interrupted run may leave, is cut off the file"""
+    if not os.path.exists(output_file):
+        return set()
+    with open(output_file, 'r+b') as results:
+        content = results.read()
+        end = content.rfind(b'\n') + 1
+        if end < len(content):
+            results.truncate(end)
+    with open(output_file, 'r') as results:
+        if output_file.endswith('.csv'):
+            return set(int(row["file level"]) for row in csv.DictReader(results))
+        return set(json.loads(line)["file level"] for line in results if line.strip())
+
+
+def numbered_levels(level_file):
+    """yields (number, number in the file, lines) of every level of the file, the
+    number counting only the levels the reader accepts, as the game and replay do"""
+    number = 0
+    for file_number, (_, lines) in enumerate(
+            LevelReader.iter_raw_levels(level_file, playable_only=False), 1):
+        accepted = LevelReader.is_playable(lines)
+        number += accepted
+        yield number if accepted else None, file_number, lines
+
+
+def analyze_pack(level_file, output_file, workers, resume=False):
+    """analyzes the levels not yet in the output file, appending each result as soon
+    as it is ready; returns the number of levels analyzed"""
+    done = finished_levels(output_file) if resume else set()
+    tasks = (task for task in numbered_levels(level_file) if task[1] not in done)
+    if workers == 1:
+        results = (analyze(task) for task in tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, configure,
+                                    (SETTINGS["timeout"], SETTINGS["max nodes"]))
+        results = pool.imap_unordered(analyze, tasks)
+
+    new_file = not resume or not os.path.exists(output_file) \
+        or os.path.getsize(output_file) == 0
+    analyzed = 0
+    with open(output_file, 'w' if new_file else 'a') as output:
+        if output_file.endswith('.csv'):
+            writer = csv.DictWriter(output, FIELDS, lineterminator='\n')
+            if new_file:
+                writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda result: output.write(json.dumps(result, sort_keys=True) + "\n")
+        try:
+            for result in results:
+                write(result)
+                output.flush()
+                analyzed += 1
+        finally:
+            if pool is not None:
+                pool.terminate()
+    return analyzed
+
+
+def main(arguments=None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="statistics and checks of a level pack")
+    parser.add_argument("level_file")
+    parser.add_argument("--output", default="analysis.jsonl",
+                        help="report file, CSV if it ends with .csv, JSON lines otherwise")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="processes analyzing levels, 1 analyzes in this process")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="seconds the solver may spend on one level")
+    parser.add_argument("--max-nodes", type=int, default=250000,
+                        help="states the solver may expand for one level")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep the output file and skip the levels already in it")
+    arguments = parser.parse_args(arguments)
+    if not os.path.exists(arguments.level_file):
+        parser.error("no such level file: %s" % arguments.level_file)
+    configure(arguments.timeout, arguments.max_nodes)
+    analyzed = analyze_pack(arguments.level_file, arguments.output,
+                            max(arguments.workers, 1), arguments.resume)
+    sys.stderr.write("%d levels analyzed\n" % analyzed)
+
+
+if __name__ == "__main__":
+    main()
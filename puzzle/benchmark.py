@@ -0,0 +1,223 @@
+"""benchmarks of the game's hot paths
+
+usage: python -m puzzle.benchmark [--output FILE] [--compare FILE] [--quick]
+
+parsing, stepping (of many boards at once too, if numpy is there), resetting,
+mirroring, rendering (through SDL's dummy video driver, so no display is needed)
+and solving are timed on the bundled levels and on generated large levels. every
+benchmark is repeated and the best run counts. results are saved as JSON and can
+be compared with the file of another commit."""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+from timeit import default_timer
+
+from puzzle.levels import LevelReader
+
+BUNDLED_LEVELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels', 'sokoban.txt')
+DIRECTION_NAMES = ("up", "down", "left", "right")
+
+
+def synthetic_level(size, seed=0):
+    """lines of a square level with a wall border, scattered walls and a few boxes"""
+    generator = random.Random(seed)
+    grid = [['#'] * size]
+    for _ in range(size - 2):
+        grid.append(['#'] + ['#' if generator.random() < 0.05 else ' '
+                             for _ in range(size - 2)] + ['#'])
+    grid.append(['#'] * size)
+    free = [(x_value, y_value) for x_value in range(1, size - 1)
+            for y_value in range(1, size - 1) if grid[x_value][y_value] == ' ']
+    generator.shuffle(free)
+    boxes = max(size // 10, 1)
+    for x_value, y_value in free[:boxes]:
+        grid[x_value][y_value] = '$'
+    for x_value, y_value in free[boxes:2 * boxes]:
+        grid[x_value][y_value] = '.'
+    x_value, y_value = free[2 * boxes]
+    grid[x_value][y_value] = '@'
+    return [''.join(line) for line in grid]
+
+
+def best_time(function, repeat):
+    """smallest wall time of repeated calls of function"""
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        function()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Benchmarks(object):
+    """runs every benchmark and collects its throughput"""
+    def __init__(self, repeat=3, scale=1):
+        self.repeat = repeat
+        self.scale = scale
+        self.reader = LevelReader()
+        self.levels = self.reader.read_levels_file(BUNDLED_LEVELS)
+        self.large_level = synthetic_level(100 * scale)
+        self.results = {}
+
+    def record(self, name, count, unit, function):
+        """times function, which handles count items, and keeps its rate"""
+        seconds = best_time(function, self.repeat)
+        self.results[name] = {"count": count,
+                              "seconds": seconds,
+                              "rate": count / seconds if seconds else None,
+                              "unit": unit}
+
+    def skip(self, name, reason):
+        """keeps the reason a benchmark could not run"""
+        self.results[name] = {"skipped": reason}
+
+    def parsing(self):
+        """reading the bundled file and building large levels"""
+        self.record("parse bundled file", len(self.levels), "levels/sec",
+                    lambda: self.reader.read_levels_file(BUNDLED_LEVELS))
+        self.record("index bundled file", len(self.levels), "levels/sec",
+                    lambda: self.reader.open_levels_file(BUNDLED_LEVELS))
+        self.record("build large level", 5, "levels/sec",
+                    lambda: [self.reader.build_board(self.large_level) for _ in range(5)])
+
+    def stepping(self):
+        """steps, finish checks, resets and mirrors on the bundled boards"""
+        generator = random.Random(1)
+        moves = [generator.choice(DIRECTION_NAMES) for _ in range(2000 * self.scale)]
+        boards = [board for board, _ in self.levels]
+
+        def step_all():
+            """every board walks the same random moves"""
+            for board in boards:
+                for direction in moves:
+                    board.step(direction)
+
+        def check_all():
+            """finish checks on every board"""
+            for board in boards:
+                for _ in range(len(moves)):
+                    board.is_finished()
+
+        self.record("step", len(boards) * len(moves), "moves/sec", step_all)
+        self.record("is_finished", len(boards) * len(moves), "checks/sec", check_all)
+        self.record("reset", len(boards), "resets/sec",
+                    lambda: [board.reset() for board in boards])
+        self.record("mirror", len(boards), "mirrors/sec",
+                    lambda: [board.mirror() for board in boards])
+
+    def batch_stepping(self):
+        """steps of many games of one bundled level at once, if numpy is there"""
+        from puzzle.levels.batch import BatchBoard, numpy
+        if numpy is None:
+            self.skip("batch step", "no numpy")
+            return
+        generator = random.Random(1)
+        batch = BatchBoard(self.levels[0][0].reset(), 10000 * self.scale)
+        codes = [numpy.array([generator.randrange(4) for _ in range(batch.count)])
+                 for _ in range(10)]
+        self.record("batch step", 100 * batch.count, "moves/sec",
+                    lambda: [batch.step(codes[move % 10]) for move in range(100)])
+
+    def solving(self):
+        """solver on the bundled levels it finishes quickly"""
+        from puzzle.solver import Solver
+        boards = [self.levels[index][0].reset() for index in (0, 1)]
+        self.record("solve", len(boards), "levels/sec",
+                    lambda: [Solver(board, 20000).solve() for board in boards])
+
+    def rendering(self):
+        """full redraws and single move repaints without a display"""
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        try:
+            import pygame
+            from puzzle.visualizers.window import Window
+            from puzzle.visualizers.renderer import LevelRenderer
+        except ImportError as error:
+            for name in ("draw_level", "render incremental move"):
+                self.skip(name, str(error))
+            return
+
+        window = Window(size=(1280, 720))
+        board = self.levels[2][0].reset()
+        frames = 20 * self.scale
+        self.record("draw_level", frames, "frames/sec",
+                    lambda: [window.draw_level(board, 1260, 700) for _ in range(frames)])
+
+        renderer = LevelRenderer(window.dicts, board, 1260, 700)
+        changed = [board.player, board.boxes_list[0], board.goal_list[0]]
+        self.record("render incremental move", frames * 10, "frames/sec",
+                    lambda: [pygame.display.update(renderer.update(window.surface_display,
+                                                                   changed))
+                             for _ in range(frames * 10)])
+        pygame.quit()
+
+    def run(self):
+        """runs all benchmarks, returns the results"""
+        self.parsing()
+        self.stepping()
+        self.batch_stepping()
+        self.solving()
+        self.rendering()
+        return self.results
+
+
+def commit():
+    """git commit of the working tree, None outside a repository"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, results, output=sys.stdout):
+    """prints the rate of every benchmark next to the previous one"""
+    for name in sorted(results):
+        rate = results[name].get("rate")
+        old_rate = previous.get("results", {}).get(name, {}).get("rate")
+        if rate and old_rate:
+            output.write("%-26s %14.1f %14.1f %7.2fx\n" % (name, old_rate, rate, rate / old_rate))
+        else:
+            output.write("%-26s %14s %14s\n" % (name, old_rate, rate))
+
+
+def main(arguments=None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="time parsing, stepping, rendering and solving")
+    parser.add_argument("--output", default="benchmark.json", help="where to save the results")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--quick", action="store_true", help="one run of each, smaller inputs")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.quick:
+        results = Benchmarks(repeat=1, scale=1).run()
+    else:
+        results = Benchmarks(repeat=3, scale=2).run()
+    report = {"commit": commit(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "results": results}
+    with open(arguments.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+
+    if arguments.compare:
+        with open(arguments.compare) as previous:
+            compare(json.load(previous), results)
+    else:
+        for name in sorted(results):
+            result = results[name]
+            if "skipped" in result:
+                sys.stdout.write("%-26s skipped: %s\n" % (name, result["skipped"]))
+            else:
+                sys.stdout.write("%-26s %14.1f %s\n" % (name, result["rate"], result["unit"]))
+
+
+if __name__ == "__main__":
+    main()
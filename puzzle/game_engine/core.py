@@ -0,0 +1,55 @@
+"""the game without display or input: the levels of a file and the one being played"""
+
+from puzzle.levels import LevelReader, LevelCache
+from puzzle.game_engine.preloader import LevelPreloader
+
+
+class GameCore(object):
+    """levels of a level file in playing order, it imports nothing of pygame so headless
+    tools and tests can play levels; prepare is the display backend's preparation of a
+    level, done in the background for the levels after the current one, or when a level
+    is taken if preload is 0"""
+    def __init__(self, level_file, prepare=None, preload=2, cache=True):
+        self.level_reader = LevelReader(LevelCache() if cache else None)
+        self.levels = self.level_reader.open_levels_file(level_file)
+        if self.levels is None:
+            raise IOError("no such level file: %s" % level_file)
+        self.index = 0
+        self.current = None  # the level being played and its preparation, once taken
+        self.prepare = prepare
+        self.preloader = None
+        if preload > 0:
+            self.preloader = LevelPreloader(self.levels, prepare, preload)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def take(self, index):
+        """the level at index and what the display backend prepared of it, None if
+        there is no preparation"""
+        if self.preloader is None:
+            level = self.levels[index]
+            if self.prepare is None or level is None:
+                return level, None
+            return level, self.prepare(level)
+        return self.preloader.take(index)
+
+    def level(self):
+        """the level being played and its preparation"""
+        if self.current is None:
+            self.current = self.take(self.index)
+        return self.current
+
+    def board(self):
+        """the solo board of the level being played"""
+        return self.level()[0][0]
+
+    def has_next(self):
+        """check if there is a level after the one being played"""
+        return self.index < len(self.levels) - 1
+
+    def next_level(self):
+        """moves on to the next level, returns it with its preparation"""
+        self.index += 1
+        self.current = None
+        return self.level()
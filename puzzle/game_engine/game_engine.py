@@ -1,36 +1,44 @@
 """this is the game engine that uses loaded level files"""
 
-from puzzle.visualizers.window import Window
+from importlib import import_module
 from puzzle.players.player import Player
-from puzzle.levels import LevelReader
+from puzzle.game_engine.core import GameCore
 
+# display and input backends by name: the module and class of the display and the module
+# of the input's event and key constants, imported only when an engine is made with them
+BACKENDS = {"pygame": ("puzzle.visualizers.window", "Window", "pygame.locals")}
 
-class PlainGameEngine(object):
-    """this is the game engine that uses loaded level files"""
 
-    def __init__(self, level_file):
-        """initializes game engine with the level file"""
-        self.window = Window()
-        self.player = Player()
+def load_backend(name):
+    """imports a backend, returns its display class and its input constants module"""
+    module, display, keys = BACKENDS[name]
+    return getattr(import_module(module), display), import_module(keys)
+
 
-        self.level_reader = LevelReader()
-        self.levels = self.load_levels(level_file)
+class PlainGameEngine(object):
+    """this is the game engine that uses loaded level files"""
 
-    def load_levels(self, level_file):
-        """loads level using the level reader"""
-        return self.level_reader.read_levels_file(level_file)
+    def __init__(self, level_file, fps=0, preload=2, backend="pygame"):
+        """initializes game engine with the level file, fps caps the window's event polling
+        (0 waits for events without polling), preload is how many levels are prepared
+        ahead in the background, backend names the display and input in BACKENDS"""
+        display, keys = load_backend(backend)
+        # the window shows its first frame before the levels and images are loaded
+        self.window = display(fps)
+        self.player = Player(keys)
+        self.core = GameCore(level_file, self.window.prepare_level, preload)
 
     def switch_level(self, index):
         """sets the level the window is supposed to show"""
-        if index < len(self.levels) - 1:
-            self.window.level = self.levels[index+1]
+        if index == self.core.index and self.core.has_next():
+            self.window.show_level(*self.core.next_level())
 
     def run(self):
         """the game's main loop"""
-        self.window.level = self.levels[0]
+        self.window.show_level(*self.core.level())
         keyword, event = self.window.display("start")
 
-        for index in range(len(self.levels)):
+        for index in range(len(self.core)):
 
             while keyword != "break":
                 keyword = self.player.command(keyword, event)
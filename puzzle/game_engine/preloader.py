@@ -0,0 +1,113 @@
+"""levels prepared in the background while the current one is played"""
+
+import atexit
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class LevelPreloader(object):
+    """builds the levels after the one being played in a worker thread, in order, and
+    hands them over through a queue bounded to the levels it may run ahead; prepare
+    is called in the worker with every level, e.g. to draw its static render layers.
+    when a level is taken out of order the worker moves on to the level after it, and
+    the levels it had already built are kept until they are taken"""
+    def __init__(self, levels, prepare=None, ahead=2, start=0):
+        self.levels = levels
+        self.prepare = prepare
+        self.ahead = max(ahead, 1)
+        self.lock = threading.Lock()  # the levels are read by the worker and by take
+        self.ready = queue.Queue(self.ahead)
+        # guards the worker's next level, the level it builds and the kept levels
+        self.position = threading.Condition()
+        self.next_index = start
+        self.building = None
+        self.stash = {}  # index -> (level, prepared) of levels built but taken out of order
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self.work)
+        self.worker.daemon = True
+        self.worker.start()
+        atexit.register(self.stop)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def build(self, index):
+        """the level at index with what prepare made of it"""
+        with self.lock:
+            level = self.levels[index]
+        if self.prepare is None or level is None:
+            return level, None
+        return level, self.prepare(level)
+
+    def work(self):
+        """builds the levels from the worker's position on, waiting while the queue is
+        full and, past the last level, until it is moved back"""
+        while True:
+            with self.position:
+                while self.next_index >= len(self.levels) and not self.stopped.is_set():
+                    self.position.wait()
+                if self.stopped.is_set():
+                    return
+                index = self.building = self.next_index
+                self.next_index += 1
+            level, prepared = self.build(index)
+            self.ready.put((index, level, prepared))
+
+    def stop(self):
+        """lets the worker finish, a level it is building is still completed"""
+        self.stopped.set()
+        with self.position:
+            self.position.notify()
+        while self.worker.is_alive():
+            try:
+                self.ready.get_nowait()
+            except queue.Empty:
+                pass
+            self.worker.join(0.01)
+
+    def take(self, index):
+        """the level at index and its prepared data without waiting for the worker;
+        queued levels before it are dropped, later ones are kept, and a level the worker
+        has not got to is built right here"""
+        with self.position:
+            if index in self.stash:
+                taken = self.stash.pop(index)
+                self.follow(index)
+                return taken
+        while True:
+            try:
+                ready_index, level, prepared = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            if ready_index == index:
+                return level, prepared
+            if ready_index > index:
+                with self.position:
+                    self.stash[ready_index] = (level, prepared)
+        with self.position:
+            self.follow(index)
+        return self.build(index)
+
+    def follow(self, index):
+        """keeps the queued levels after index the worker may run ahead to and moves the
+        worker to the first level after index that is neither kept nor being built;
+        called holding position"""
+        while True:
+            try:
+                ready_index, level, prepared = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            self.stash[ready_index] = (level, prepared)
+        for kept in list(self.stash):
+            if not index < kept <= index + self.ahead:
+                del self.stash[kept]
+        following = index + 1
+        while following in self.stash or following == self.building:
+            following += 1
+        if self.next_index != following:
+            self.next_index = following
+            self.position.notify()
@@ -1,4 +1,5 @@
 """levels module"""
 
 from puzzle.levels.level import Map, Board
-from puzzle.levels.levelreader import LevelReader
+from puzzle.levels.levelreader import LevelReader, LevelCollection
+from puzzle.levels.cache import LevelCache
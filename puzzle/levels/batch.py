@@ -0,0 +1,114 @@
+"""many boards of one level stepped at once with numpy, which is optional"""
+
+from puzzle.levels.compact import WALL, GOAL, BOX
+from puzzle.levels.level import LURD
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# direction codes of the batch: the index of the LURD letter in this string
+LURD_ORDER = 'lurd'
+
+
+class BatchBoard(object):
+    """count independent games of one board's level: the player of every game is a flat
+    index of the board's compact layout and the boxes of all games are one boolean array
+    of count rows laid end to end, so a step of all games is a few array operations;
+    walls and goals are shared as they never move"""
+    def __init__(self, board, count):
+        if numpy is None:
+            raise ImportError("the batch simulator needs numpy")
+        state = board.state
+        cells = numpy.frombuffer(bytes(state.cells), dtype=numpy.uint8)
+        self.size = len(cells)
+        self.stride = state.stride
+        self.count = count
+        self.walls = (cells & WALL) != 0
+        self.goals = (cells & GOAL) != 0
+        self.offsets = numpy.array([state.offsets[LURD[letter]] for letter in LURD_ORDER],
+                                   dtype=numpy.intp)
+        self.rows = numpy.arange(count, dtype=numpy.intp) * self.size
+        self.start_player = state.player
+        self.start_boxes = (cells & BOX) != 0
+        self.box_count = int(self.start_boxes.sum())
+        self.player = None
+        self.boxes = None
+        self.boxes_on_goals = None
+        self.reset()
+
+    @staticmethod
+    def encode(moves):
+        """direction codes of a LURD string up to its first letter that is not a move,
+        pushes may be upper case"""
+        codes = []
+        for letter in moves.lower():
+            if letter not in LURD_ORDER:
+                break
+            codes.append(LURD_ORDER.index(letter))
+        return numpy.array(codes, dtype=numpy.intp)
+
+    def reset(self):
+        """puts every game back to the position of the board the batch was made of"""
+        self.player = numpy.full(self.count, self.start_player, dtype=numpy.intp)
+        self.boxes = numpy.tile(self.start_boxes, self.count)
+        self.boxes_on_goals = numpy.full(self.count, int((self.start_boxes & self.goals).sum()),
+                                         dtype=numpy.intp)
+        return self
+
+    def step(self, directions, active=None):
+        """makes one step in every game, directions holds a code per game or one code for
+        all; games not in the active mask stay put; returns the legal and the solved
+        masks of the games"""
+        offset = self.offsets[directions]
+        destination = self.player + offset
+        beyond = numpy.clip(destination + offset, 0, self.size - 1)
+        box = self.boxes[self.rows + destination]
+        legal = ~self.walls[destination]
+        legal &= ~(box & (self.walls[beyond] | self.boxes[self.rows + beyond]))
+        if active is not None:
+            legal &= active
+        pushes = numpy.flatnonzero(legal & box)
+        if len(pushes):
+            source, target = destination[pushes], beyond[pushes]
+            self.boxes[self.rows[pushes] + source] = False
+            self.boxes[self.rows[pushes] + target] = True
+            self.boxes_on_goals[pushes] += self.goals[target].astype(numpy.intp) \
+                - self.goals[source]
+        self.player = numpy.where(legal, destination, self.player)
+        return legal, self.is_finished()
+
+    def is_finished(self):
+        """mask of the games with all boxes on goals"""
+        return self.boxes_on_goals == self.box_count
+
+    def replay(self, solutions):
+        """replays a LURD string in every game from the start, like Board.replay; returns
+        how many moves of each string were legal in a row and the solved mask"""
+        self.reset()
+        encoded = [self.encode(moves) for moves in solutions]
+        lengths = numpy.array([len(moves) for moves in encoded], dtype=numpy.intp)
+        codes = numpy.zeros((self.count, lengths.max() if self.count else 0), dtype=numpy.intp)
+        for game, moves in enumerate(encoded):
+            codes[game, :len(moves)] = moves
+        legal_moves = numpy.zeros(self.count, dtype=numpy.intp)
+        active = lengths > 0
+        for move in range(codes.shape[1]):
+            legal, _ = self.step(codes[:, move], active)
+            legal_moves += legal
+            active = legal & (lengths > move + 1)
+            if not active.any():
+                break
+        return legal_moves, self.is_finished()
+
+    def positions(self, game):
+        """the player's and the boxes' board positions in a game"""
+        row = self.boxes[game * self.size:(game + 1) * self.size]
+        return self.position(self.player[game]), [self.position(index)
+                                                  for index in numpy.flatnonzero(row)]
+
+    def position(self, index):
+        """board position of a flat index"""
+        x_value, y_value = divmod(int(index), self.stride)
+        return x_value - 1, y_value - 1
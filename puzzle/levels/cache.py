@@ -0,0 +1,199 @@
+"""binary on-disk cache of parsed level files"""
+
+import hashlib
+import mmap
+import os
+import struct
+
+from puzzle.levels import level as lev
+
+MAGIC = b'SOKC'
+VERSION = 2
+# magic, version, level file mtime, size and sha1, number of levels
+HEADER = struct.Struct('<4sHdQ20sI')
+# width, height, player x and y, number of goals, number of boxes; all 0 for a level
+# that does not make a correct board, so the cache numbers levels like the level file
+RECORD = struct.Struct('<6H')
+
+
+def default_directory():
+    """cache directory from SOKOBAN_CACHE_DIR, or ~/.cache/sokoban"""
+    return os.environ.get('SOKOBAN_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'sokoban'))
+
+
+class LevelCache(object):
+    """keeps the prepared boards of each level file in one binary file: a header with the
+    level file's mtime, size and content hash, a table of record offsets, then per level
+    the packed classified grid, its dead square bitmap and goal, box and player positions;
+    a cache file that cannot be read is treated as missing, so it is made again"""
+    def __init__(self, directory=None):
+        self.directory = directory or default_directory()
+
+    def cache_path(self, filename):
+        """cache file of a level file, named after its absolute path"""
+        name = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.levels')
+
+    @staticmethod
+    def digest(filename):
+        """sha1 of the level file's content"""
+        content_hash = hashlib.sha1()
+        with open(filename, 'rb') as level_file:
+            for block in iter(lambda: level_file.read(1 << 16), b''):
+                content_hash.update(block)
+        return content_hash.digest()
+
+    def load(self, filename):
+        """returns the cached levels of the file, None if there is no valid cache;
+        a cache whose mtime or size is stale but whose content hash matches is kept"""
+        cache_path = self.cache_path(filename)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            levels = CachedLevels(cache_path)
+            status = os.stat(filename)
+            magic, version, mtime, size, digest, _ = levels.header
+            if magic != MAGIC or version != VERSION:
+                levels.close()
+                return None
+            if (mtime, size) != (status.st_mtime, status.st_size):
+                levels.close()
+                if size != status.st_size or digest != self.digest(filename):
+                    return None
+                self.touch(cache_path, status)
+                levels = CachedLevels(cache_path)
+        except (ValueError, struct.error, EnvironmentError):
+            return None
+        return levels
+
+    @staticmethod
+    def touch(cache_path, status):
+        """updates the level file's mtime kept in the cache header"""
+        with open(cache_path, 'r+b') as cache_file:
+            header = list(HEADER.unpack(cache_file.read(HEADER.size)))
+            header[2] = status.st_mtime
+            cache_file.seek(0)
+            cache_file.write(HEADER.pack(*header))
+
+    def store(self, filename, boards):
+        """writes the prepared boards of the file to its cache, None standing for a level
+        that is not a correct board; returns the cached levels or None if the cache
+        directory is not writable"""
+        status = os.stat(filename)
+        records = [self.pack_board(board) for board in boards]
+        table = struct.pack('<%dI' % len(records), *self.offsets(records))
+        header = HEADER.pack(MAGIC, VERSION, status.st_mtime, status.st_size,
+                             self.digest(filename), len(records))
+
+        cache_path = self.cache_path(filename)
+        temporary_path = '%s.%d' % (cache_path, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(temporary_path, 'wb') as cache_file:
+                cache_file.write(header)
+                cache_file.write(table)
+                for record in records:
+                    cache_file.write(record)
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            os.rename(temporary_path, cache_path)
+        except (IOError, OSError):
+            return None
+        return CachedLevels(cache_path)
+
+    @staticmethod
+    def offsets(records):
+        """absolute offsets of the records, placed after the header and the offset table"""
+        offset = HEADER.size + 4 * len(records)
+        offsets = []
+        for record in records:
+            offsets.append(offset)
+            offset += len(record)
+        return offsets
+
+    @staticmethod
+    def pack_board(board):
+        """packs a board's starting state with its classified grid and dead squares, an
+        empty record for None"""
+        if board is None:
+            return RECORD.pack(0, 0, 0, 0, 0, 0)
+        grid = b''.join(''.join(row).encode('latin-1') for row in board.map_grid.prepared_grid())
+        start = board.starting_state["player"]
+        boxes = board.starting_state["boxes"]
+        positions = [value for position in board.goal_list + boxes for value in position]
+        return RECORD.pack(board.width, board.height, start[0], start[1],
+                           len(board.goal_list), len(boxes)) \
+            + grid + bytes(board.map_grid.dead_squares) \
+            + struct.pack('<%dH' % len(positions), *positions)
+
+
+class CachedLevels(object):
+    """sequence of the levels of a cache file read through mmap, each board is built
+    from its record when indexed, without parsing or preparing its map; a file too short
+    for its header, offset table and records raises ValueError or struct.error"""
+    def __init__(self, cache_path):
+        with open(cache_path, 'rb') as cache_file:
+            self.buffer = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.header = HEADER.unpack_from(self.buffer, 0)
+            self.count = self.header[5]
+            self.check_size()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+        self.last_built = (None, None)  # (index, level) of the level built most recently
+
+    def check_size(self):
+        """raises ValueError if the file cannot hold its records"""
+        size = len(self.buffer)
+        if size < HEADER.size + self.count * (4 + RECORD.size):
+            raise ValueError("truncated level cache")
+        offsets = struct.unpack_from('<%dI' % self.count, self.buffer, HEADER.size)
+        if any(offset + RECORD.size > size for offset in offsets):
+            raise ValueError("level cache record out of range")
+
+    def close(self):
+        """releases the mapping"""
+        self.buffer.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """builds the board and its mirror of the level at index, None if it is incorrect"""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("level index out of range")
+        if self.last_built[0] != index:
+            board = self.read_board(index)
+            self.last_built = (index, None if board is None else (board, board.mirror()))
+        return self.last_built[1]
+
+    def read_board(self, index):
+        """unpacks the record of the level at index into a board, None for an empty one"""
+        offset = struct.unpack_from('<I', self.buffer, HEADER.size + 4 * index)[0]
+        width, height, start_x, start_y, goals, boxes = RECORD.unpack_from(self.buffer, offset)
+        if width == 0:
+            return None
+        offset += RECORD.size
+        grid = self.buffer[offset:offset + width * height]
+        if not isinstance(grid, str):
+            grid = grid.decode('latin-1')
+        offset += width * height
+        dead_squares = bytearray(self.buffer[offset:offset + width * height])
+        offset += width * height
+        positions = struct.unpack_from('<%dH' % (2 * (goals + boxes)), self.buffer, offset)
+        positions = list(zip(positions[::2], positions[1::2]))
+
+        board = lev.Board()
+        board.goal_list = positions[:goals]
+        board.boxes_list = positions[goals:]
+        board.player = (start_x, start_y)
+        board.save_state((start_x, start_y))
+        board.set_map(lev.Map.from_prepared(
+            [list(grid[x_value * height:(x_value + 1) * height]) for x_value in range(width)],
+            dead_squares))
+        return board
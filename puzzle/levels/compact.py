@@ -0,0 +1,359 @@
+"""compact array representation of a board's state"""
+
+import hashlib
+import heapq
+import struct
+
+WALL = 1
+GOAL = 2
+BOX = 4
+# translation tables clearing the box flag of every cell at once, and keeping only it
+WITHOUT_BOXES = bytes(bytearray(flags & ~BOX for flags in range(256)))
+ONLY_BOXES = bytes(bytearray(flags & BOX for flags in range(256)))
+
+
+class ZobristKeys(dict):
+    """64 bit keys by flat index, each made when it is first looked up from a hash of
+    the index, so the key of an index is the same for every board and every run and a
+    big board costs nothing for the squares no box or player region is ever on"""
+    def __init__(self, salt):
+        dict.__init__(self)
+        self.salt = salt
+
+    def __missing__(self, index):
+        digest = hashlib.md5(('%s %d' % (self.salt, index)).encode('ascii')).digest()
+        key = struct.unpack('<Q', digest[:8])[0]
+        self[index] = key
+        return key
+
+
+# zobrist keys of a box and of the player's region per flat index
+BOX_KEYS = ZobristKeys('box')
+PLAYER_KEYS = ZobristKeys('player')
+
+
+class CompactBoard(object):
+    """one byte of flags per square on the board surrounded by an extra wall border,
+    so every step is a flat index offset without bounds checks"""
+    __slots__ = ('width', 'height', 'stride', 'cells', 'offsets',
+                 'player', 'box_count', 'boxes_on_goals', 'box_hash', 'player_region',
+                 'reachability')
+
+    def __init__(self, width, height, directions):
+        self.width = width
+        self.height = height
+        self.stride = height + 2
+        self.cells = bytearray([WALL]) * ((width + 2) * self.stride)
+        self.offsets = dict((name, self.offset(direction))
+                            for name, direction in directions.items())
+        self.player = None
+        self.box_count = 0
+        self.boxes_on_goals = 0
+        self.box_hash = 0  # xor of the keys of all box squares
+        self.player_region = None  # lowest square the player reaches, None until needed
+        self.reachability = None  # made by reach() on the first search
+
+    def index(self, position):
+        """flat index of a board position"""
+        return (position[0] + 1) * self.stride + position[1] + 1
+
+    def position(self, index):
+        """board position of a flat index"""
+        x_value, y_value = divmod(index, self.stride)
+        return x_value - 1, y_value - 1
+
+    def offset(self, direction):
+        """flat index difference of a step in the given direction"""
+        return direction[0] * self.stride + direction[1]
+
+    def cell(self, position):
+        """flags of a board position, positions outside the board are walls"""
+        if 0 <= position[0] < self.width and 0 <= position[1] < self.height:
+            return self.cells[self.index(position)]
+        return WALL
+
+    def set_walls(self, flags):
+        """takes the wall flags of all cells at once, laid out like self.cells"""
+        self.cells = bytearray(flags)
+        self.player_region = None
+
+    def add_goal(self, position):
+        """marks a goal at position"""
+        index = self.index(position)
+        if self.cells[index] & BOX:
+            self.boxes_on_goals += 1
+        self.cells[index] |= GOAL
+
+    def set_boxes(self, positions):
+        """replaces all boxes with boxes at the given positions"""
+        self.cells = cells = self.cells.translate(WITHOUT_BOXES)
+        self.box_count = 0
+        self.boxes_on_goals = 0
+        self.box_hash = 0
+        self.player_region = None
+        for position in positions:
+            index = self.index(position)
+            cells[index] |= BOX
+            self.box_count += 1
+            self.box_hash ^= BOX_KEYS[index]
+            if cells[index] & GOAL:
+                self.boxes_on_goals += 1
+
+    def box_positions(self):
+        """positions of all boxes in index order, found by searching the cells with only
+        their box flags left"""
+        boxes = bytes(self.cells.translate(ONLY_BOXES))
+        box = bytes(bytearray([BOX]))
+        positions = []
+        index = boxes.find(box)
+        while index >= 0:
+            positions.append(self.position(index))
+            index = boxes.find(box, index + 1)
+        return positions
+
+    def move_box(self, source, destination):
+        """moves a box between two flat indices, keeping the count of boxes on goals
+        and the box hash"""
+        cells = self.cells
+        cells[source] &= ~BOX
+        cells[destination] |= BOX
+        self.box_hash ^= BOX_KEYS[source] ^ BOX_KEYS[destination]
+        self.player_region = None
+        self.boxes_on_goals += (cells[destination] & GOAL) // GOAL - (cells[source] & GOAL) // GOAL
+
+    def step(self, direction):
+        """makes a step, returns the index the pushed box lands on, -1 for a plain step
+        and None if the step is impossible"""
+        offset = self.offsets[direction]
+        cells = self.cells
+        destination = self.player + offset
+        if cells[destination] & WALL:
+            return None
+        if cells[destination] & BOX:
+            beyond = destination + offset
+            if cells[beyond] & (WALL | BOX):
+                return None
+            self.move_box(destination, beyond)
+            self.player = destination
+            return beyond
+        self.player = destination
+        return -1
+
+    def pull(self, direction, drag=True):
+        """the reverse move of a push: steps in direction dragging the box behind the
+        player along if drag is on; returns the index the dragged box lands on, -1 for a
+        plain step and None if the step is impossible"""
+        offset = self.offsets[direction]
+        cells = self.cells
+        source = self.player
+        destination = source + offset
+        if cells[destination] & (WALL | BOX):
+            return None
+        self.player = destination
+        if drag and cells[source - offset] & BOX:
+            self.move_box(source - offset, source)
+            return source
+        return -1
+
+    def place_player(self, index):
+        """puts the player on a flat index, possibly in another region"""
+        self.player = index
+        self.player_region = None
+
+    def unstep(self, direction, pushed):
+        """takes back a step made in direction, pulling back the box if it was a push"""
+        offset = self.offsets[direction]
+        if pushed:
+            self.move_box(self.player + offset, self.player)
+        self.player -= offset
+
+    def is_finished(self):
+        """all boxes stand on goals"""
+        return self.boxes_on_goals == self.box_count
+
+    def reach(self):
+        """the reachability engine of this board"""
+        if self.reachability is None:
+            self.reachability = Reachability(self)
+        return self.reachability
+
+    def lowest_reachable(self):
+        """lowest flat index the player can reach without pushing a box"""
+        return self.reach().lowest()
+
+    def position_key(self):
+        """zobrist hash of the boxes and the player's region; moving the box hash is
+        O(1) per push, the region is found again only after a push changed it"""
+        if self.player_region is None:
+            self.player_region = self.lowest_reachable()
+        return self.box_hash ^ PLAYER_KEYS[self.player_region]
+
+
+class Reachability(object):
+    """breadth first searches of the squares the player reaches without pushing, over
+    buffers allocated once per board; a square is visited when its mark equals the
+    generation of the current search, so nothing is cleared between searches and the
+    last search is reused while the boxes stay put and the player stays in its area"""
+    __slots__ = ('state', 'marks', 'parents', 'queue', 'generation', 'count',
+                 'complete', 'box_hash', 'steps', 'names', 'found_pushes')
+
+    def __init__(self, state):
+        self.state = state
+        size = len(state.cells)
+        self.marks = [0] * size
+        self.parents = [-1] * size
+        self.queue = [0] * size
+        self.generation = 0
+        self.count = 0
+        self.complete = False
+        self.box_hash = None
+        self.steps = tuple(state.offsets.values())
+        self.names = dict((offset, name) for name, offset in state.offsets.items())
+        self.found_pushes = (None, [])  # (generation, pushes) of the last pushes() call
+
+    def search(self, target=None, start=None):
+        """marks the squares reachable from the player, or from start, stops early once
+        target is found"""
+        state = self.state
+        cells, marks, parents, queue = state.cells, self.marks, self.parents, self.queue
+        self.generation += 1
+        generation = self.generation
+        if start is None:
+            start = state.player
+        marks[start] = generation
+        parents[start] = -1
+        queue[0] = start
+        head, tail = 0, 1
+        self.complete = True
+        while head < tail:
+            index = queue[head]
+            head += 1
+            if index == target:
+                self.complete = False
+                break
+            for step in self.steps:
+                neighbour = index + step
+                if marks[neighbour] != generation and not cells[neighbour] & (WALL | BOX):
+                    marks[neighbour] = generation
+                    parents[neighbour] = index
+                    queue[tail] = neighbour
+                    tail += 1
+        self.count = tail
+        # a search from elsewhere describes no area of the player
+        self.box_hash = state.box_hash if start == state.player else None
+
+    def area(self):
+        """runs a full search unless the last one still describes the player's area"""
+        state = self.state
+        if not self.complete or self.box_hash != state.box_hash \
+                or self.marks[state.player] != self.generation:
+            self.search()
+        return self.queue[:self.count]
+
+    def can_reach(self, index):
+        """check if the player can walk to index"""
+        self.area()
+        return self.marks[index] == self.generation
+
+    def lowest(self):
+        """lowest flat index of the player's area"""
+        return min(self.area())
+
+    def pushes(self):
+        """(box index, direction name) of every push the player can walk to and make"""
+        area = self.area()
+        if self.found_pushes[0] == self.generation:
+            return list(self.found_pushes[1])
+        cells = self.state.cells
+        pushes = []
+        for index in area:
+            for name, offset in self.state.offsets.items():
+                box = index + offset
+                if cells[box] & BOX and not cells[box + offset] & (WALL | BOX):
+                    pushes.append((box, name))
+        self.found_pushes = (self.generation, pushes)
+        return list(pushes)
+
+    def path(self, target):
+        """direction names of a shortest walk from the player to target, None if the
+        player cannot get there without pushing"""
+        state = self.state
+        if self.box_hash != state.box_hash or self.parents[state.player] != -1 \
+                or self.marks[state.player] != self.generation \
+                or (not self.complete and self.marks[target] != self.generation):
+            self.search(target)
+        if self.marks[target] != self.generation:
+            return None
+        return self.walk_back(target)
+
+    def walk_back(self, target):
+        """direction names of the walk the last search found from its start to target"""
+        names, parents = self.names, self.parents
+        path = []
+        while parents[target] != -1:
+            path.append(names[target - parents[target]])
+            target = parents[target]
+        path.reverse()
+        return path
+
+    def push_path(self, box, target):
+        """direction names of the walk with the fewest pushes, then the fewest moves, that
+        takes the box at box to target without touching other boxes; None if there is
+        none. an A* search over the box's square and the side the player pushed from"""
+        state = self.state
+        cells, marks, offsets = state.cells, self.marks, state.offsets
+        if box == target:
+            return []
+        if not cells[box] & BOX or cells[target] & (WALL | BOX):
+            return None
+        stride = state.stride
+
+        def estimate(index):
+            """pushes needed to reach target without obstacles"""
+            return abs(index // stride - target // stride) + abs(index % stride - target % stride)
+
+        # nodes are (box square, direction of the last push), each keeps its cost, the
+        # node it came from and the walk and push leading to it from there
+        found = {}
+        queue = []
+        counter = 0
+        cells[box] &= ~BOX
+        try:
+            node, player, pushes, moves = None, state.player, 0, 0
+            while True:
+                square = node[0] if node else box
+                cells[square] |= BOX
+                self.search(start=player)
+                cells[square] &= ~BOX
+                for name, offset in offsets.items():
+                    side, destination = square - offset, square + offset
+                    if marks[side] != self.generation or cells[destination] & (WALL | BOX):
+                        continue
+                    walk = self.walk_back(side)
+                    cost = (pushes + 1, moves + len(walk) + 1)
+                    child = (destination, name)
+                    if child not in found or found[child][0] > cost:
+                        found[child] = (cost, node, walk + [name])
+                        counter += 1
+                        heapq.heappush(queue, (cost[0] + estimate(destination), cost[1],
+                                               counter, child, cost))
+                while queue:
+                    _, _, _, node, cost = heapq.heappop(queue)
+                    if found[node][0] == cost:
+                        break
+                else:
+                    return None
+                if node[0] == target:
+                    break
+                pushes, moves = cost
+                player = node[0] - offsets[node[1]]
+        finally:
+            cells[box] |= BOX
+            # the searches ran with the box elsewhere, none of them describes the board
+            self.box_hash = None
+
+        path = []
+        while node is not None:
+            _, node, steps = found[node]
+            path[:0] = steps
+        return path
@@ -0,0 +1,65 @@
+"""level file formats besides plain text: run-length encoded XSB lines and SLC XML"""
+
+import re
+from xml.etree.ElementTree import iterparse
+
+# characters of XSB rows; '-' and '_' are floor like ' '
+XSB_FLOOR = ('-', '_')
+RLE_CHARACTERS = frozenset('0123456789#@+$*. -_|()')
+RLE_TOKEN = re.compile(r'(\d*)([^\d()]|\((?:[^()]*)\))')
+
+
+def is_rle(line):
+    """check if a line is run-length encoded: counts or row separators and nothing but
+    level characters"""
+    return any(character.isdigit() or character == '|' for character in line) \
+        and all(character in RLE_CHARACTERS for character in line)
+
+
+def decode_rle(line):
+    """rows of a run-length encoded line: a count repeats the character or the
+    parenthesised group after it and '|' separates rows"""
+    decoded = []
+    for count, token in RLE_TOKEN.findall(line):
+        if token.startswith('('):
+            token = decode_rle(token[1:-1])
+            token = '|'.join(token)
+        decoded.append(token * int(count or 1))
+    return ''.join(decoded).split('|')
+
+
+def xsb_rows(line):
+    """the rows of a level line, decoded if run-length encoded, with floor as spaces"""
+    rows = decode_rle(line) if is_rle(line) else [line]
+    for floor in XSB_FLOOR:
+        rows = [row.replace(floor, ' ') for row in rows]
+    return rows
+
+
+def is_slc(filename):
+    """check if a level file is an SLC XML collection, by its extension"""
+    return filename.lower().endswith(('.slc', '.xml'))
+
+
+def local_name(tag):
+    """tag without its XML namespace"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_slc_levels(filename):
+    """yields (level number from 0, rows) of every level of an SLC collection; the
+    file is parsed as a stream and every level is dropped once it is read, so a large
+    collection is never held in memory as a whole"""
+    number = 0
+    context = iterparse(filename, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event != 'end' or local_name(element.tag) != 'Level':
+            continue
+        rows = []
+        for line in element:
+            if local_name(line.tag) == 'L':
+                rows.extend(xsb_rows(line.text or ''))
+        yield number, rows
+        number += 1
+        root.clear()
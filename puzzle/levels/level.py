@@ -1,24 +1,49 @@
 """anything connected to the game board and the creation of it"""
 
+from collections import deque
 from copy import deepcopy
+from operator import add
+import random
+import zlib
+
+from puzzle.levels.compact import CompactBoard, GOAL, BOX
 
 DIRECTIONS = {"up": (0, -1),
               "down": (0, 1),
               "right": (1, 0),
               "left": (-1, 0)}
 
+# LURD notation used by level collections and solvers; lines of a level file
+# run along the board's x axis, so "u" moves to the previous line of the file
+LURD = {"u": "left",
+        "d": "right",
+        "l": "up",
+        "r": "down"}
+LETTERS = dict((direction, letter) for letter, direction in LURD.items())
+
+# decorations are a function of the level and this seed only
+DECORATION_SEED = 0
+# translation table turning the bytes of a grid row into 1 for walls and 0 for floor
+WALL_TILES = bytes(bytearray(int(chr(code) in ('#', 'x')) for code in range(256)))
+
 
 class Board(object):
-    """game board with all amenities"""
+    """game board with all amenities, a facade over its compact state"""
     def __init__(self):
         self.width = None
         self.height = None
         self.map_grid = None
+        self.state = None
+        self.pending = {"player": None, "boxes": []}  # kept until the map is set
 
         self.boxes_list = []
         self.goal_list = []
         self.player = None
+        self.last_push = None
         self.starting_state = {}
+        # one LURD letter per move made since the start, upper case for pushes
+        self.journal = []
+        self.journal_position = 0  # number of journal moves currently made
 
     def is_correct(self):
         """checking the board created from file for nonsense"""
@@ -36,16 +61,61 @@ class Board(object):
         return True
 
     def set_map(self, map_grid):
-        """establish board map, height and width"""
-        self.map_grid = Map(map_grid, self.starting_state["player"])
+        """establish board map, height and width; map_grid is a list of rows or a ready Map"""
+        if not isinstance(map_grid, Map):
+            map_grid = Map(map_grid, self.starting_state["player"], self.goal_list)
+        self.map_grid = map_grid
         self.height = self.map_grid.height
         self.width = self.map_grid.width
+        self.set_state()
+
+    def set_state(self):
+        """builds the compact state from the map, the goals and the current boxes and player"""
+        player, boxes = self.player, self.boxes_list
+        self.state = CompactBoard(self.width, self.height, DIRECTIONS)
+        self.state.set_walls(self.map_grid.wall_flags(border=1))
+        for goal in self.goal_list:
+            self.state.add_goal(goal)
+        self.player = player
+        self.boxes_list = boxes
+
+    @property
+    def player(self):
+        """player position"""
+        if self.state is None:
+            return self.pending["player"]
+        return self.state.position(self.state.player)
+
+    @player.setter
+    def player(self, position):
+        """moves the player to position"""
+        if self.state is None:
+            self.pending["player"] = position
+        else:
+            self.state.place_player(self.state.index(position))
+
+    @property
+    def boxes_list(self):
+        """list of box positions"""
+        if self.state is None:
+            return self.pending["boxes"]
+        return self.state.box_positions()
+
+    @boxes_list.setter
+    def boxes_list(self, positions):
+        """puts boxes at the given positions only"""
+        if self.state is None:
+            self.pending["boxes"] = positions
+        else:
+            self.state.set_boxes(positions)
 
     def reset(self):
-        """resets board to the starting state"""
-        self.set_map(self.map_grid.map_grid)
+        """resets board to the starting state and clears the journal"""
         self.player = self.starting_state["player"]
-        self.boxes_list = deepcopy(self.starting_state["boxes"])
+        self.boxes_list = self.starting_state["boxes"]
+        self.last_push = None
+        self.journal = []
+        self.journal_position = 0
         return self
 
     def save_state(self, start):
@@ -65,8 +135,53 @@ class Board(object):
         """check if position marks a wall"""
         return self.map_grid.is_wall(position)
 
+    def has_box(self, position):
+        """check if there is a box at position"""
+        return self.state.cell(position) & BOX != 0
+
+    def has_goal(self, position):
+        """check if position marks a goal"""
+        return self.state.cell(position) & GOAL != 0
+
+    def is_deadlocked(self, position=None):
+        """check if the box at position, by default the one pushed last, can never reach a goal"""
+        if position is None:
+            position = self.last_push
+        if position is None or not self.has_box(position):
+            return False
+        return self.map_grid.is_deadlock(position, self.has_box, self.has_goal)
+
+    def reachable_area(self):
+        """positions the player can walk to without pushing a box"""
+        state = self.state
+        return set(state.position(index) for index in state.reach().area())
+
+    def can_reach(self, position):
+        """check if the player can walk to position without pushing a box"""
+        return self.is_inside(position) \
+            and self.state.reach().can_reach(self.state.index(position))
+
+    def legal_pushes(self):
+        """(box position, direction) of every push the player can walk to and make"""
+        state = self.state
+        return [(state.position(box), direction) for box, direction in state.reach().pushes()]
+
+    def walk_path(self, position):
+        """directions of a shortest walk to position without pushing, None if there is none"""
+        if not self.is_inside(position):
+            return None
+        return self.state.reach().path(self.state.index(position))
+
+    def push_path(self, box, target):
+        """directions of a walk with the fewest pushes that moves the box at box to target,
+        pushing no other box; None if there is none"""
+        if not self.is_inside(box) or not self.is_inside(target):
+            return None
+        state = self.state
+        return state.reach().push_path(state.index(box), state.index(target))
+
     def mirror(self):
-        """create a mirrored board, but differently decorated"""
+        """create a mirrored board, its map and decorations mirrored too"""
         start = self.starting_state["player"]
         start = (self.width - start[0] - 1, start[1])
         mirror = Board()
@@ -74,7 +189,7 @@ class Board(object):
         mirror.boxes_list = self.mirror_position_list(self.boxes_list)
         mirror.player = start
         mirror.save_state(start)
-        mirror.set_map(self.map_grid.map_grid[::-1])
+        mirror.set_map(self.map_grid.mirror())
         return mirror
 
     def mirror_position_list(self, tile_list):
@@ -83,21 +198,77 @@ class Board(object):
 
     def step(self, direction):
         """makes a step or pushed a box if possible"""
-        direction = DIRECTIONS[direction]
-        destination = self.move(self.player, direction)
-
-        if not self.is_wall(destination):
-            if destination in self.boxes_list:
-                if not self.is_wall(self.move(destination, direction)) \
-                        and self.move(destination, direction) not in self.boxes_list:
-                    index = self.boxes_list.index(destination)
-                    self.boxes_list[index] = self.move(self.boxes_list[index], direction)
-                    self.player = self.move(self.player, direction)
-                    return True
-            else:
-                self.player = self.move(self.player, direction)
-                return True
-        return False
+        pushed = self.state.step(direction)
+        if pushed is None:
+            return False
+        self.last_push = None if pushed < 0 else self.state.position(pushed)
+        del self.journal[self.journal_position:]
+        self.journal.append(LETTERS[direction].upper() if pushed >= 0 else LETTERS[direction])
+        self.journal_position += 1
+        return True
+
+    def pull(self, direction, drag=True):
+        """makes a reverse move, stepping away from a box and dragging it along if drag is
+        on; pulls are not moves of the game, so they clear the journal"""
+        pulled = self.state.pull(direction, drag)
+        if pulled is None:
+            return False
+        self.last_push = None if pulled < 0 else self.state.position(pulled)
+        self.journal = []
+        self.journal_position = 0
+        return True
+
+    def undo(self):
+        """takes back the last move, returns False if there is none"""
+        if self.journal_position == 0:
+            return False
+        self.journal_position -= 1
+        letter = self.journal[self.journal_position]
+        self.state.unstep(LURD[letter.lower()], letter.isupper())
+        self.last_push = None
+        if self.journal_position > 0 and self.journal[self.journal_position - 1].isupper():
+            direction = DIRECTIONS[LURD[self.journal[self.journal_position - 1].lower()]]
+            self.last_push = self.move(self.player, direction)
+        return True
+
+    def redo(self):
+        """makes the next undone move again, returns False if there is none"""
+        if self.journal_position == len(self.journal):
+            return False
+        letter = self.journal[self.journal_position]
+        pushed = self.state.step(LURD[letter.lower()])
+        self.last_push = None if pushed < 0 else self.state.position(pushed)
+        self.journal_position += 1
+        return True
+
+    def jump(self, move):
+        """undoes or redoes moves until the first move moves of the journal are made"""
+        move = max(0, min(move, len(self.journal)))
+        while self.journal_position > move:
+            self.undo()
+        while self.journal_position < move:
+            self.redo()
+        return self
+
+    def restart(self):
+        """goes back to the start by undoing the journal, which is kept for redo"""
+        return self.jump(0)
+
+    def position_key(self):
+        """hash of the position, equal for the same boxes with the player anywhere in the
+        same region, however the position was reached"""
+        return self.state.position_key()
+
+    def moves(self):
+        """LURD string of the moves made so far"""
+        return ''.join(self.journal[:self.journal_position])
+
+    def replay(self, moves):
+        """makes the steps of a LURD string, returns how many of them were legal in a row"""
+        for count, letter in enumerate(moves):
+            if letter.lower() not in LURD or not self.step(LURD[letter.lower()]):
+                return count
+        return len(moves)
 
     @staticmethod
     def move(what, where):
@@ -106,19 +277,64 @@ class Board(object):
 
     def is_finished(self):
         """recognizes a finished game"""
-        return all([box in self.goal_list for box in self.boxes_list])
+        return self.state.is_finished()
 
 
 class Map(object):
     """advanced map grid that can be interpreted by visualizer classes"""
-    def __init__(self, map_obj, start):
+    def __init__(self, map_obj, start, goals=(), seed=DECORATION_SEED):
         self.decoration_count = 20
         self.map_grid = map_obj
         self.height = len(map_obj[0])
         self.width = len(map_obj)
         self.map_grid = self.clean_map()
         self.flood_fill(start, ' ', 'o')
+        self.mark_corners()
+        self.level_id = self.grid_id()
+        self.seed = seed
         self.decorate()
+        self.dead_squares = self.find_dead_squares(goals)
+
+    @classmethod
+    def from_prepared(cls, map_grid, dead_squares, seed=DECORATION_SEED):
+        """map from an undecorated grid with floor and walls already classified,
+        e.g. one read from the level cache; only the decoration is done anew"""
+        prepared = cls.__new__(cls)
+        prepared.decoration_count = 20
+        prepared.map_grid = map_grid
+        prepared.height = len(map_grid[0])
+        prepared.width = len(map_grid)
+        prepared.dead_squares = dead_squares
+        prepared.level_id = prepared.grid_id()
+        prepared.seed = seed
+        prepared.decorate()
+        return prepared
+
+    def mirror(self):
+        """the map mirrored along its x axis, decorations and dead squares included, so
+        nothing is classified or decorated again"""
+        mirrored = Map.__new__(Map)
+        mirrored.decoration_count = self.decoration_count
+        mirrored.map_grid = [list(row) for row in self.map_grid[::-1]]
+        mirrored.height = self.height
+        mirrored.width = self.width
+        mirrored.dead_squares = bytearray(b''.join(
+            bytes(self.dead_squares[x_value * self.height:(x_value + 1) * self.height])
+            for x_value in reversed(range(self.width))))
+        mirrored.level_id = self.level_id
+        mirrored.seed = self.seed
+        return mirrored
+
+    def grid_id(self):
+        """checksum of the undecorated grid, the same for a level wherever it is read"""
+        grid = ''.join(''.join(row) for row in self.prepared_grid())
+        return zlib.crc32(('%dx%d:%s' % (self.width, self.height, grid)).encode('latin-1')) \
+            & 0xffffffff
+
+    def prepared_grid(self):
+        """the classified grid without decorations"""
+        return [[' ' if tile in ('1', '2', '3', '4') else tile for tile in row]
+                for row in self.map_grid]
 
     def get_tile(self, position):
         """shortcut to the grid"""
@@ -126,7 +342,8 @@ class Map(object):
 
     def clean_map(self):
         """deep copy of map, with all but floor and walls removed"""
-        return [[self.clean_tile(element) for element in row] for row in self.map_grid]
+        return [[element if element in ('#', 'x') else ' ' for element in row]
+                for row in self.map_grid]
 
     @staticmethod
     def clean_tile(element):
@@ -139,11 +356,7 @@ class Map(object):
 
     def is_inside(self, position):
         """check if position is inside board boundaries"""
-        x_value, y_value = position
-        if x_value in range(self.width) and y_value in range(self.height):
-            return True
-        else:
-            return False
+        return 0 <= position[0] < self.width and 0 <= position[1] < self.height
 
     def is_wall(self, position):
         """check if position marks a wall"""
@@ -153,46 +366,153 @@ class Map(object):
         else:
             return False
 
+    def flat_tiles(self):
+        """the grid flattened line by line with a border of None around it, so a
+        neighbour of a square is one index step away: +-1 along y, +-(height + 2) along x"""
+        stride = self.height + 2
+        tiles = [None] * stride
+        for row in self.map_grid:
+            tiles.append(None)
+            tiles.extend(row)
+            tiles.append(None)
+        tiles.extend([None] * stride)
+        return tiles
+
+    def set_flat_tiles(self, tiles):
+        """replaces the grid with the inside of flat tiles"""
+        stride = self.height + 2
+        self.map_grid = [tiles[(x_value + 1) * stride + 1:(x_value + 2) * stride - 1]
+                         for x_value in range(self.width)]
+
     def flood_fill(self, position, tile, re_tile):
-        """differentiate outside floor from inside floor, to be able to decorate the outside"""
-        x_value, y_value = position
-        if tile != re_tile and self.is_inside(position):
-            # print x_value, y_value, "out of", self.width, self.height
-            if self.map_grid[x_value][y_value] == tile:
-                self.map_grid[x_value][y_value] = re_tile
-                self.flood_fill((x_value - 1, y_value), tile, re_tile)
-                self.flood_fill((x_value + 1, y_value), tile, re_tile)
-                self.flood_fill((x_value, y_value - 1), tile, re_tile)
-                self.flood_fill((x_value, y_value + 1), tile, re_tile)
-
-    def decorate(self):
-        """mark wall intersections as corners to display different graphics"""
-        import random
+        """differentiate outside floor from inside floor, to be able to decorate the outside;
+        a breadth first search over the flat tiles, so large open areas cannot run into
+        the recursion limit"""
+        if tile == re_tile or not self.is_inside(position) or self.get_tile(position) != tile:
+            return
+        stride = self.height + 2
+        steps = (-1, 1, -stride, stride)
+        tiles = self.flat_tiles()
+        start = (position[0] + 1) * stride + position[1] + 1
+        tiles[start] = re_tile
+        queue = deque([start])
+        visit, next_square = queue.append, queue.popleft
+        while queue:
+            square = next_square()
+            for step in steps:
+                near = square + step
+                if tiles[near] == tile:
+                    tiles[near] = re_tile
+                    visit(near)
+        self.set_flat_tiles(tiles)
+
+    def wall_flags(self, border=0):
+        """flat tiles turned into 1 for walls and 0 for floor, the border gets the given flag;
+        every row is translated at once and the rows are joined into one bytearray"""
+        edge = bytes(bytearray([border]))
+        rows = [''.join(row).encode('latin-1').translate(WALL_TILES) for row in self.map_grid]
+        outside = edge * (self.height + 2)
+        return bytearray(outside + b''.join(edge + row + edge for row in rows) + outside)
+
+    def mark_corners(self):
+        """mark wall intersections as corners to display different graphics; neighbour
+        counts of all squares are summed at once from shifted copies of the wall flags"""
+        stride = self.height + 2
+        tiles = self.flat_tiles()
+        walls = self.wall_flags()
+        size = len(tiles)
+        inner = slice(stride, size - stride)
+        along_y = map(add, walls[stride - 1:size - stride - 1], walls[stride + 1:size - stride + 1])
+        along_x = map(add, walls[:size - 2 * stride], walls[2 * stride:])
+        # a wall with more than two wall neighbours, or with two that do not form
+        # a straight line, is a corner
+        tiles[inner] = ['x' if tile == '#' and (line_y + line_x > 2 or line_y == line_x == 1)
+                        else tile for tile, line_y, line_x in zip(tiles[inner], along_y, along_x)]
+        self.set_flat_tiles(tiles)
+
+    def decorate(self, seed=None):
+        """put decorations on the outside floor, the same ones for the same level and
+        seed; a new seed replaces the decorations in a new grid"""
+        if seed is not None:
+            self.seed = seed
+            self.map_grid = self.prepared_grid()
+        # only random() is used, it gives the same numbers on every python version
+        generator = random.Random((self.level_id << 32) + self.seed)
         for row in self.map_grid:
-            x_value = self.map_grid.index(row)
-            for y_value in range(len(row)):
-                # recognize corners
-                if self.map_grid[x_value][y_value] == '#':
-                    count_walls = 0
-                    straight_line1 = 0
-                    straight_line2 = 0
-                    if self.is_wall((x_value, y_value - 1)):
-                        count_walls += 1
-                        straight_line1 += 1
-                    if self.is_wall((x_value, y_value + 1)):
-                        count_walls += 1
-                        straight_line1 += 1
-                    if self.is_wall((x_value - 1, y_value)):
-                        count_walls += 1
-                        straight_line2 += 1
-                    if self.is_wall((x_value + 1, y_value)):
-                        count_walls += 1
-                        straight_line2 += 1
-
-                    if count_walls > 2 or \
-                            (count_walls == 2 and straight_line1 < 2 and straight_line2 < 2):
-                        self.map_grid[x_value][y_value] = 'x'
-
-                elif self.map_grid[x_value][y_value] == ' ' \
-                        and random.randint(0, 99) < self.decoration_count:
-                    self.map_grid[x_value][y_value] = str(random.choice(range(4)) + 1)
+            for y_value, tile in enumerate(row):
+                if tile == ' ' and int(generator.random() * 100) < self.decoration_count:
+                    row[y_value] = str(int(generator.random() * 4) + 1)
+
+    def find_dead_squares(self, goals):
+        """bitmap of squares from which a box can never be pushed onto any goal"""
+        stride = self.height + 2
+        steps = (-1, 1, -stride, stride)
+        walls = self.wall_flags(border=1)
+        dead_squares = bytearray(b'\x01' * len(walls))
+        queue = deque()
+        for goal in goals:
+            square = (goal[0] + 1) * stride + goal[1] + 1
+            dead_squares[square] = 0
+            queue.append(square)
+        # pull boxes away from the goals: a box pushed from before onto square
+        # needs the player standing one more step back
+        visit, next_square = queue.append, queue.popleft
+        while queue:
+            square = next_square()
+            for step in steps:
+                before = square - step
+                if dead_squares[before] and not walls[before] and not walls[before - step]:
+                    dead_squares[before] = 0
+                    visit(before)
+        return bytearray(b''.join(bytes(dead_squares[(x_value + 1) * stride + 1:
+                                                     (x_value + 2) * stride - 1])
+                                  for x_value in range(self.width)))
+
+    def is_dead_square(self, position):
+        """check if a box at position can never reach a goal, whatever other boxes do"""
+        if not self.is_inside(position):
+            return True
+        return self.dead_squares[position[0] * self.height + position[1]] == 1
+
+    def is_deadlock(self, position, has_box, is_goal):
+        """check if the box at position is stuck off goal: on a dead square,
+        in a 2x2 block of walls and boxes, or frozen together with other boxes"""
+        if not is_goal(position) and self.is_dead_square(position):
+            return True
+        for x_value in (position[0] - 1, position[0]):
+            for y_value in (position[1] - 1, position[1]):
+                block = [(x_value, y_value), (x_value + 1, y_value),
+                         (x_value, y_value + 1), (x_value + 1, y_value + 1)]
+                if all(self.is_wall(square) or has_box(square) for square in block) \
+                        and any(has_box(square) and not is_goal(square) for square in block):
+                    return True
+        frozen = self.frozen_boxes(position, has_box, ())
+        return frozen is not None and not all(is_goal(box) for box in frozen)
+
+    def frozen_boxes(self, position, has_box, walls):
+        """boxes frozen together with the box at position, None if it can still move;
+        walls holds boxes already being examined, which count as walls"""
+        walls = set(walls)
+        walls.add(position)
+        frozen = [position]
+        for axis in ((1, 0), (0, 1)):
+            blocking = self.blocking_boxes(position, axis, has_box, walls)
+            if blocking is None:
+                return None
+            frozen.extend(blocking)
+        return frozen
+
+    def blocking_boxes(self, position, axis, has_box, walls):
+        """frozen boxes that block a box along an axis, None if it is not blocked"""
+        before = (position[0] - axis[0], position[1] - axis[1])
+        after = (position[0] + axis[0], position[1] + axis[1])
+        if before in walls or after in walls or self.is_wall(before) or self.is_wall(after):
+            return []
+        if self.is_dead_square(before) and self.is_dead_square(after):
+            return []
+        for side in (before, after):
+            if has_box(side):
+                frozen = self.frozen_boxes(side, has_box, walls)
+                if frozen is not None:
+                    return frozen
+        return None
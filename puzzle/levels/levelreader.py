@@ -2,12 +2,14 @@
 
 from os import path
 from puzzle.levels import level as lev
+from puzzle.levels import formats
 
 
 class LevelReader(object):
     """allows one to create a board object based on a file"""
-    def __init__(self):
+    def __init__(self, cache=None):
         self.levels = []
+        self.cache = cache  # LevelCache used by open_levels_file, if any
 
     @staticmethod
     def read_file(filename):
@@ -35,23 +37,34 @@ class LevelReader(object):
         level_width = max([len(element) for element in raw_level])
         return [list(element + (' ' * (level_width - len(element)))) for element in raw_level]
 
-    def build_level(self, level):
-        """creates board object and its mirror image from raw data lines"""
+    @staticmethod
+    def is_playable(level):
+        """cheap check of raw level lines, done before anything is built: a player,
+        at least one goal and no fewer boxes than goals"""
+        goals = boxes = 0
+        has_player = False
+        for line in level:
+            has_player = has_player or '@' in line or '+' in line
+            goals += line.count('.') + line.count('+') + line.count('*')
+            boxes += line.count('$') + line.count('*')
+        return has_player and goals > 0 and boxes >= goals
+
+    def build_board(self, level):
+        """creates board object from raw data lines"""
         board = lev.Board()
 
         start = None
-        for line in level:
-            x_value = level.index(line)
-            y_value = -1
-            for element in line:
-                y_value += 1
+        boxes = []
+        for x_value, line in enumerate(level):
+            for y_value, element in enumerate(line):
                 if element in ('@', '+'):
                     start = (x_value, y_value)
                     board.player = start
                 if element in ('.', '+', '*'):
                     board.goal_list.append((x_value, y_value))
                 if element in ('$', '*'):
-                    board.boxes_list.append((x_value, y_value))
+                    boxes.append((x_value, y_value))
+        board.boxes_list = boxes
 
         level = self.pad_lines(level)
 
@@ -59,31 +72,125 @@ class LevelReader(object):
         board.set_map(level)
         if not board.is_correct():
             return None
+        else:
+            return board
+
+    def build_level(self, level):
+        """creates board object and its mirror image from raw data lines"""
+        board = self.build_board(level)
+        if board is None:
+            return None
         else:
             return board, board.mirror()
 
+    @classmethod
+    def level_rows(cls, raw_line):
+        """the cleaned rows of a raw line; a run-length encoded line may hold several"""
+        line = cls.clean_line(raw_line)
+        if line == '':
+            return []
+        return formats.xsb_rows(line)
+
+    @classmethod
+    def iter_raw_levels(cls, filename, playable_only=True):
+        """yields (byte offset, cleaned lines) of every playable level, or of every level
+        if playable_only is off, reading the file one line at a time; levels of an SLC
+        collection are streamed the same way, with their number in the file as offset"""
+        if formats.is_slc(filename):
+            for number, level_lines in formats.iter_slc_levels(filename):
+                if not playable_only or cls.is_playable(level_lines):
+                    yield number, level_lines
+            return
+        with open(filename, 'rb') as level_file:
+            offset = start = 0
+            level_lines = []  # contains the lines for a single level's map.
+            for raw_line in level_file:
+                if not isinstance(raw_line, str):
+                    raw_line = raw_line.decode('latin-1')
+                rows = cls.level_rows(raw_line)
+                if rows:
+                    if not level_lines:
+                        start = offset
+                    level_lines.extend(rows)
+                elif len(level_lines) > 0:
+                    if not playable_only or cls.is_playable(level_lines):
+                        yield start, level_lines
+                    level_lines = []
+                offset += len(raw_line)
+            if level_lines and (not playable_only or cls.is_playable(level_lines)):
+                yield start, level_lines
+
+    def iter_levels(self, filename):
+        """yields board objects and their mirror images one level at a time"""
+        for _, level_lines in self.iter_raw_levels(filename):
+            level = self.build_level(level_lines)
+            if level is not None:
+                yield level
+
     def read_levels_file(self, filename):
         """returns board object created from file"""
         if not path.exists(filename):
             # run error message here
             return None
         else:
-            all_raw_levels = self.read_file(filename)
-
-            # clean previous data
-            self.levels = []
-
-            level_lines = []  # contains the lines for a single level's map.
-            for line in all_raw_levels:
-                line = self.clean_line(line)
-
-                if line != '':
-                    level_lines.append(line)
-                elif line == '' and len(level_lines) > 0:
-                    # level_lines contains now all lines for a single level
-                    board = self.build_level(level_lines)
-                    if board is not None:
-                        self.levels.append(board)
-                    level_lines = []
-
+            self.levels = list(self.iter_levels(filename))
         return self.levels
+
+    def open_levels_file(self, filename):
+        """returns a lazy collection of the file's levels, None if there is no such file;
+        with a cache, the levels are prepared and stored once and read from the cache later"""
+        if not path.exists(filename):
+            return None
+        if self.cache is not None:
+            levels = self.cache.load(filename)
+            if levels is None:
+                # incorrect levels are stored as None, keeping the numbering of LevelCollection
+                levels = self.cache.store(filename, [self.build_board(lines) for _, lines
+                                                     in self.iter_raw_levels(filename)])
+            if levels is not None:
+                return levels
+        return LevelCollection(self, filename)
+
+
+class LevelCollection(object):
+    """sequence of a level file's levels, indexed by byte offset and built on access;
+    an SLC file cannot be seeked into, so its rows are kept as one string per level"""
+    def __init__(self, level_reader, filename):
+        self.level_reader = level_reader
+        self.filename = filename
+        self.offsets = []
+        self.packed_rows = [] if formats.is_slc(filename) else None
+        for offset, level_lines in level_reader.iter_raw_levels(filename):
+            self.offsets.append(offset)
+            if self.packed_rows is not None:
+                self.packed_rows.append("\n".join(level_lines))
+        self.last_built = (None, None)  # (index, level) of the level built most recently
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        """builds the board and its mirror of the level at index, None if it is incorrect"""
+        if index < 0:
+            index += len(self.offsets)
+        if not 0 <= index < len(self.offsets):
+            raise IndexError("level index out of range")
+        if self.last_built[0] != index:
+            self.last_built = (index, self.level_reader.build_level(self.read_lines(index)))
+        return self.last_built[1]
+
+    def read_lines(self, index):
+        """seeks to the level and reads its cleaned lines"""
+        if self.packed_rows is not None:
+            return self.packed_rows[index].split("\n")
+        level_lines = []
+        with open(self.filename, 'rb') as level_file:
+            level_file.seek(self.offsets[index])
+            for raw_line in level_file:
+                if not isinstance(raw_line, str):
+                    raw_line = raw_line.decode('latin-1')
+                rows = self.level_reader.level_rows(raw_line)
+                if not rows:
+                    break
+                level_lines.extend(rows)
+        return level_lines
@@ -1,12 +1,15 @@
 """action interpreters"""
 
-import pygame.locals as key
+from importlib import import_module
 import sys
 
 
 class Player(object):
-    """players' action interpreter"""
-    def __init__(self):
+    """players' action interpreter, keys is the input backend's module of event and key
+    constants named like pygame.locals, which it is unless another one is given"""
+    def __init__(self, keys=None):
+        self.keys = keys if keys is not None else import_module('pygame.locals')
+        key = self.keys
         self.last_command = "start"
         self.commands = {"start": self.move_in_starting_screen,
                          "error": self.move_in_error_screen,
@@ -19,6 +22,8 @@ class Player(object):
         self.dual_dictionary = {key.K_a: "left_B", key.K_d: "right_B",
                                 key.K_w: "up_B", key.K_s: "down_B"}
         self.dual_dictionary.update(self.solo_dictionary)
+        # moves of the dual game are not journaled together, so undo is for the solo game only
+        self.solo_dictionary.update({key.K_u: "undo", key.K_r: "redo", key.K_HOME: "restart"})
 
     def command(self, context, event):
         """chooses function to call based on context"""
@@ -26,9 +31,9 @@ class Player(object):
         if context in self.commands:
             return self.commands[context](event)
 
-    @staticmethod
-    def check_if_quit(event):
+    def check_if_quit(self, event):
         """the only legal way to quit the running program (in all the modules)"""
+        key = self.keys
         if event.type == key.QUIT:
             sys.exit()
         elif event.type == key.KEYDOWN:
@@ -42,6 +47,7 @@ class Player(object):
 
     def move_in_starting_screen(self, event):
         """represents actions that can be made in the starting screen"""
+        key = self.keys
         self.last_command = "start"
         if event.type == key.KEYDOWN:
             if event.key == key.K_s:
@@ -52,6 +58,7 @@ class Player(object):
 
     def move_in_error_screen(self, event):
         """represents actions that can be made in the error screen"""
+        key = self.keys
         self.last_command = "error"
         if event.type == key.KEYDOWN:
             return "start"
@@ -59,14 +66,20 @@ class Player(object):
 
     def move_in_solo_mode(self, event):
         """represents actions that can be made in the error screen"""
+        key = self.keys
         self.last_command = "solo"
         if event.type == key.KEYDOWN:
             if event.key in self.solo_dictionary:
                 return self.solo_dictionary[event.key]
+        if event.type == key.MOUSEBUTTONDOWN and event.button == 1:
+            return "grab"
+        if event.type == key.MOUSEBUTTONUP and event.button == 1:
+            return "drop"
         return "freeze"
 
     def move_in_dual_mode(self, event):
         """represents actions that can be made in the error screen"""
+        key = self.keys
         self.last_command = "dual"
         if event.type == key.KEYDOWN:
             if event.key in self.dual_dictionary:
@@ -75,6 +88,7 @@ class Player(object):
 
     def switch_levels(self, event):
         """called by game engine to switch to next level"""
+        key = self.keys
         # i need event variable for uniform function call in command
         event.key = key.KEYDOWN     # use the variable to silence a warning
         return self.last_command
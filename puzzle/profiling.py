@@ -0,0 +1,137 @@
+"""opt-in timing of the game's hot paths
+
+set SOKOBAN_PROFILE to a report file, or start puzzle/run.py with --profile FILE, to
+time level loading, stepping, drawing and display updates and to show the frame rate
+over the game; SOKOBAN_CPROFILE or --cprofile FILE also keeps cProfile statistics.
+nothing is wrapped unless profiling is enabled. the report is written as JSON when the
+game exits."""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import platform
+import time
+from timeit import default_timer
+
+PROFILE = None  # profile of this session once enabled
+
+
+class Timer(object):
+    """count, total and longest duration of a hot path, with a histogram of its
+    durations in power of two microseconds"""
+    __slots__ = ('count', 'total', 'longest', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.histogram = {}
+
+    def record(self, seconds):
+        """adds one duration"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.longest:
+            self.longest = seconds
+        bucket = int(seconds * 1e6).bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def report(self):
+        """the counters as a dictionary, histogram buckets named by their upper bound"""
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count if self.count else 0.0,
+                "longest": self.longest,
+                "histogram": dict(("<%dus" % (1 << bucket), count)
+                                  for bucket, count in sorted(self.histogram.items()))}
+
+
+class Profile(object):
+    """timers of one session, the hot paths are wrapped by instrument"""
+    def __init__(self, report_path, cprofile_path=None):
+        self.report_path = report_path
+        self.cprofile_path = cprofile_path
+        self.timers = {}
+        self.sources = {}  # name: function returning more counters for the report
+        self.start = time.time()
+        self.profiler = None
+        if cprofile_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def timer(self, name):
+        """the timer of a name, made on first use"""
+        if name not in self.timers:
+            self.timers[name] = Timer()
+        return self.timers[name]
+
+    def wrap(self, owner, attribute, name):
+        """replaces a function of a class or module with one timing its calls"""
+        function = owner.__dict__[attribute]
+        record = self.timer(name).record
+        clock = default_timer
+
+        @functools.wraps(function)
+        def timed(*arguments, **keywords):
+            """calls the wrapped function, recording how long it took"""
+            start = clock()
+            try:
+                return function(*arguments, **keywords)
+            finally:
+                record(clock() - start)
+        setattr(owner, attribute, timed)
+
+    def instrument(self):
+        """wraps the game's hot paths, pygame's display update included if it is there"""
+        from puzzle.levels.level import Board
+        from puzzle.levels.levelreader import LevelReader, LevelCollection
+        from puzzle.levels.cache import LevelCache, CachedLevels
+        self.wrap(Board, 'step', "board step")
+        self.wrap(LevelReader, 'build_level', "build level")
+        self.wrap(LevelCollection, '__getitem__', "load level")
+        self.wrap(CachedLevels, '__getitem__', "load cached level")
+        self.wrap(LevelCache, 'load', "open level cache")
+        self.wrap(LevelCache, 'store', "write level cache")
+        try:
+            import pygame
+            from puzzle.visualizers.window import Window
+            from puzzle.visualizers.renderer import LevelRenderer
+        except ImportError:
+            return
+        self.wrap(Window, 'draw_level', "draw level")
+        self.wrap(LevelRenderer, 'draw_static_layer', "draw static layer")
+        self.wrap(LevelRenderer, 'draw', "draw renderer")
+        self.wrap(LevelRenderer, 'update', "update tiles")
+        self.wrap(pygame.display, 'update', "display update")
+
+    def report(self):
+        """the whole session's counters"""
+        report = {"python": platform.python_version(),
+                  "session time": time.time() - self.start,
+                  "timers": dict((name, timer.report()) for name, timer in self.timers.items())}
+        for name, source in self.sources.items():
+            report[name] = source()
+        return report
+
+    def write(self):
+        """saves the report and the cProfile statistics"""
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.cprofile_path)
+        with open(self.report_path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2, sort_keys=True)
+
+
+def enable(report_path=None, cprofile_path=None):
+    """turns profiling on if a report or cProfile file is given, here or through the
+    environment; returns the session's profile, None while profiling is off"""
+    global PROFILE
+    report_path = report_path or os.environ.get('SOKOBAN_PROFILE')
+    cprofile_path = cprofile_path or os.environ.get('SOKOBAN_CPROFILE')
+    if PROFILE is None and (report_path or cprofile_path):
+        PROFILE = Profile(report_path or 'sokoban-profile.json', cprofile_path)
+        PROFILE.instrument()
+        atexit.register(PROFILE.write)
+    return PROFILE
@@ -0,0 +1,95 @@
+"""headless replay of LURD solutions against a level pack, without pygame
+
+usage: python -m puzzle.replay LEVEL_FILE SOLUTION_FILE [--workers N]
+
+every non-empty line of the solution file holds a level number (counted from 1
+over the levels the reader accepts) and a LURD string; ';' starts a comment.
+one JSON object per solution is written to stdout as soon as it is checked."""
+
+import argparse
+import json
+import multiprocessing
+import sys
+
+from puzzle.levels import LevelReader
+
+LEVELS = []  # level pack of the current process, loaded once by load_levels
+
+
+def load_levels(level_file):
+    """reads the level pack into this process"""
+    global LEVELS
+    LEVELS = LevelReader().read_levels_file(level_file) or []
+
+
+def read_solutions(solution_file):
+    """yields (level number, moves) pairs from the solution file"""
+    with open(solution_file, 'r') as solutions:
+        for line in solutions:
+            line = LevelReader.clean_line(line).strip()
+            if line:
+                number, _, moves = line.partition(' ')
+                yield number, moves.strip()
+
+
+def check(solution):
+    """replays one solution on a fresh board, returns its result record"""
+    number, moves = solution
+    if number.isdigit():
+        number = int(number)
+    result = {"level": number, "moves": len(moves)}
+    if number not in range(1, len(LEVELS) + 1):
+        result["result"] = "unknown level"
+        return result
+
+    board = LEVELS[number - 1][0].reset()
+    legal = board.replay(moves)
+    if legal < len(moves):
+        result["result"] = "illegal"
+        result["illegal move"] = legal
+    elif board.is_finished():
+        result["result"] = "solved"
+    else:
+        result["result"] = "failed"
+    return result
+
+
+def replay(level_file, solution_file, workers, output=sys.stdout):
+    """checks all solutions, streaming JSON lines to output, returns the number of
+    solutions that did not solve their level"""
+    solutions = read_solutions(solution_file)
+    if workers == 1:
+        load_levels(level_file)
+        results = (check(solution) for solution in solutions)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, load_levels, (level_file,))
+        results = pool.imap(check, solutions, 64)
+
+    unsolved = 0
+    try:
+        for result in results:
+            if result["result"] != "solved":
+                unsolved += 1
+            output.write(json.dumps(result, sort_keys=True) + "\n")
+            output.flush()
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return unsolved
+
+
+def main(arguments=None):
+    """command line entry point, exits with 1 if any solution failed"""
+    parser = argparse.ArgumentParser(description="replay LURD solutions without a display")
+    parser.add_argument("level_file")
+    parser.add_argument("solution_file")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="processes checking solutions, 1 checks in this process")
+    arguments = parser.parse_args(arguments)
+    unsolved = replay(arguments.level_file, arguments.solution_file, max(arguments.workers, 1))
+    sys.exit(1 if unsolved else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
 """this script starts the game"""
 
+import argparse
 import os
+from puzzle import profiling
 from puzzle.game_engine.game_engine import PlainGameEngine
 
+parser = argparse.ArgumentParser(description="sokoban")
+parser.add_argument("--profile", metavar="FILE",
+                    help="time the hot paths, show the frame rate and save a JSON report")
+parser.add_argument("--cprofile", metavar="FILE", help="also save cProfile statistics")
+arguments = parser.parse_args()
+profiling.enable(arguments.profile, arguments.cprofile)
+
 PlainGameEngine(os.path.join('levels', 'sokoban.txt')).run()
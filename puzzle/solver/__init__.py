@@ -0,0 +1,5 @@
+"""solvers module"""
+
+from puzzle.solver.solver import Solver, solve
+from puzzle.solver.bidirectional import BidirectionalSolver
+from puzzle.solver.portfolio import solve_portfolio
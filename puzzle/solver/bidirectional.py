@@ -0,0 +1,107 @@
+"""search from the start with pushes and from the goals with pulls until they meet"""
+
+import heapq
+from collections import deque
+from itertools import count
+
+from puzzle.solver.solver import Solver, INFINITY
+
+
+class BidirectionalSolver(Solver):
+    """the forward A* search of Solver and a breadth first search of pulls from every
+    position with all boxes on goals, taking turns; both record the states they expand
+    in one index, and a state one search expands after the other did joins the forward
+    pushes to it with the pushes undoing the pulls back to the goals. the solution is
+    not push optimal, and the table shared with other searches is not used"""
+
+    def goal_players(self):
+        """a player square next to the goals in every region the player may be in once
+        all boxes are on goals"""
+        players = {}
+        for goal in self.goals:
+            for step in self.steps:
+                player = goal + step
+                if not self.walls[player] and not self.goal_squares[player]:
+                    players.setdefault(self.reach(player, self.goals)[1], player)
+        return list(players.values())
+
+    def pulls(self, boxes, marks):
+        """yields (sorted boxes, player square after the pull, pull) of every pull of a box
+        by the player, who walks to the squares marked 2; a pull moves a box by a step"""
+        for number, box in enumerate(boxes):
+            for step in self.steps:
+                target = box + step
+                if marks[target] != 2 or marks[target + step] == 1:
+                    continue
+                moved = list(boxes)
+                moved[number] = target
+                yield tuple(sorted(moved)), target + step, (box, step)
+
+    def solve(self):
+        """returns a LURD string solving the board, None when there is no solution or none
+        was found within max_nodes expanded states of both searches and time_limit seconds"""
+        self.limit_reached = None
+        if len(self.boxes) != len(self.goals) or self.estimate(self.boxes) >= INFINITY:
+            return None
+
+        # the index of both searches: state -> (search, parent state, push or pull)
+        index = {}
+        tie_breaker = count()
+        nearest = self.nearest
+        forward = [(sum(nearest[box] for box in self.boxes), 0, next(tie_breaker), self.boxes,
+                    self.player, None, None)]
+        backward = deque((self.goals, player, None, None) for player in self.goal_players())
+        self.nodes = 0
+        while forward:  # once no push is left, there is no solution
+            self.nodes += 1
+            if self.nodes > self.max_nodes:
+                self.limit_reached = "nodes"
+                return None
+            if self.out_of_time():
+                return None
+
+            if self.nodes & 1 or not backward:
+                _, pushes, _, boxes, player, parent, push = heapq.heappop(forward)
+                marks, lowest = self.reach(player, boxes)
+                state = (boxes, lowest)
+                if state in index:
+                    if index[state][0] == "backward":
+                        return self.moves(self.joined(index, state, (parent, push)))
+                    continue
+                index[state] = ("forward", parent, push)
+                if boxes == self.goals:
+                    return self.moves(self.joined(index, state, (parent, push), (None, None)))
+                pushes -= 1  # stored negated, so deeper states win ties
+                bound = sum(nearest[box] for box in boxes)
+                for moved, box, step, target in self.successors(boxes, marks):
+                    estimate = bound - nearest[box] + nearest[target]
+                    heapq.heappush(forward, (estimate - pushes, pushes, next(tie_breaker),
+                                             moved, box, state, (box, step)))
+            else:
+                boxes, player, parent, pull = backward.popleft()
+                marks, lowest = self.reach(player, boxes)
+                state = (boxes, lowest)
+                if state in index:
+                    if index[state][0] == "forward":
+                        return self.moves(self.joined(index, state, None, (parent, pull)))
+                    continue
+                index[state] = ("backward", parent, pull)
+                for moved, behind, pull in self.pulls(boxes, marks):
+                    backward.append((moved, behind, state, pull))
+        return None
+
+    def joined(self, index, state, forward_link=None, backward_link=None):
+        """the pushes from the start to the goals through the state where the searches
+        met; the link not yet in the index is the one the meeting search came by"""
+        pushes = []
+        parent, push = forward_link if forward_link is not None else index[state][1:]
+        while parent is not None:
+            pushes.append(push)
+            parent, push = index[parent][1:]
+        pushes.reverse()
+        parent, pull = backward_link if backward_link is not None else index[state][1:]
+        while parent is not None:
+            box, step = pull
+            pushes.append((box + step, -step))
+            parent, pull = index[parent][1:]
+        return pushes
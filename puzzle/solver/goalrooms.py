@@ -0,0 +1,118 @@
+"""tables of the ways adjacent goals can be filled, worked out before a search"""
+
+import time
+from collections import deque
+
+GOAL_ROOM_LIMIT = 12  # most goals a room may have, its table has 2 ** goals entries
+GOAL_ROOM_STATES = 200000  # most states worked out for one room before giving up on it
+
+
+def find_goal_rooms(solver):
+    """rooms of at least two goals connected by steps between goals, with their tables,
+    leaving out the rooms that can be filled in any order"""
+    goals = set(solver.goals)
+    rooms = []
+    while goals:
+        square = goals.pop()
+        squares = [square]
+        queue = deque([square])
+        while queue:
+            square = queue.popleft()
+            for step in solver.steps:
+                if square + step in goals:
+                    goals.remove(square + step)
+                    squares.append(square + step)
+                    queue.append(square + step)
+        if 2 <= len(squares) <= GOAL_ROOM_LIMIT:
+            room = GoalRoom(solver, squares)
+            if room.table is not None and 0 in room.table:  # a full table prunes nothing
+                rooms.append(room)
+    return rooms
+
+
+class GoalRoom(object):
+    """adjacent goals and a table telling which sets of boxes on them can still become
+    a full room; the table is made by pulling boxes out of the full room, dropping a box
+    once it leaves, with no boxes outside it, so a set of boxes missing from the table
+    can be completed in no position of the level"""
+    def __init__(self, solver, squares):
+        self.squares = tuple(sorted(squares))
+        self.bits = dict((square, 1 << number) for number, square in enumerate(self.squares))
+        self.table = self.fill_table(solver)
+
+    def mask(self, boxes):
+        """bit mask of the boxes on the room's goals"""
+        bits = self.bits
+        mask = 0
+        for box in boxes:
+            if box in bits:
+                mask |= bits[box]
+        return mask
+
+    def allows(self, boxes):
+        """check if the boxes in the room can still make it full"""
+        return self.table[self.mask(boxes)]
+
+    def regions(self, solver, mask):
+        """numbers every square by the region the player walks in with the boxes of the
+        mask in the room, walls and boxes get -1"""
+        labels = [-1 if wall else 0 for wall in solver.walls]
+        for square in self.squares:
+            if mask & self.bits[square]:
+                labels[square] = -1
+        region = 0
+        for start, label in enumerate(labels):
+            if label:
+                continue
+            region += 1
+            labels[start] = region
+            stack = [start]
+            while stack:
+                square = stack.pop()
+                for step in solver.steps:
+                    near = square + step
+                    if not labels[near]:
+                        labels[near] = region
+                        stack.append(near)
+        return labels
+
+    def fill_table(self, solver):
+        """marks every set of boxes a breadth first search of pulls reaches from the full
+        room, None if there are more states than GOAL_ROOM_STATES or the solver's deadline
+        passes first"""
+        table = bytearray(1 << len(self.squares))
+        full = (1 << len(self.squares)) - 1
+        regions = {full: self.regions(solver, full)}  # labels of every mask seen
+        queue = deque()
+        seen = set()
+        for square in self.squares:
+            for step in solver.steps:
+                region = regions[full][square + step]
+                if region > 0 and (full, region) not in seen:
+                    seen.add((full, region))
+                    queue.append((full, region))
+        while queue:
+            if solver.deadline is not None and time.time() > solver.deadline:
+                return None
+            mask, region = queue.popleft()
+            table[mask] = 1
+            labels = regions[mask]
+            for box in self.squares:
+                if not mask & self.bits[box]:
+                    continue
+                for step in solver.steps:
+                    target = box + step
+                    behind = target + step
+                    if labels[target] != region or labels[behind] < 0:
+                        continue
+                    moved = mask & ~self.bits[box] | self.bits.get(target, 0)
+                    if moved not in regions:
+                        regions[moved] = self.regions(solver, moved)
+                    state = (moved, regions[moved][behind])
+                    if state in seen:
+                        continue
+                    if len(seen) >= GOAL_ROOM_STATES:
+                        return None
+                    seen.add(state)
+                    queue.append(state)
+        return table
@@ -0,0 +1,212 @@
+"""several searches of one level in parallel processes, sharing the positions they expand
+
+usage: python -m puzzle.solver.portfolio LEVEL_FILE LEVEL [--workers N]
+                                         [--timeout SECONDS] [--max-nodes N]
+
+the level is counted from 1 over the levels the reader accepts. every worker runs one
+of CONFIGURATIONS; the forward searches that skip nothing record the positions they
+expand in a hash table in shared memory, which the others read. the first solution
+found, or a proof that there is none, stops the others. the result and the nodes per
+second of every worker are written to stdout as JSON."""
+
+import argparse
+import ctypes
+import json
+import multiprocessing
+import sys
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from puzzle.levels import LevelReader
+from puzzle.solver.solver import Solver
+from puzzle.solver.bidirectional import BidirectionalSolver
+
+SEARCHES = {"forward": Solver, "bidirectional": BidirectionalSolver}
+# searches in the order workers get them, the first skips nothing so every portfolio
+# has a complete search; the push optimal search records the positions it expands, the
+# pruning forward searches skip those it expanded after fewer pushes than they need, as
+# it goes on from there itself
+CONFIGURATIONS = ({"name": "optimal", "search": "forward", "weight": 1,
+                   "heuristic": "matching", "prune": False},
+                  {"name": "bidirectional", "search": "bidirectional", "weight": 1,
+                   "heuristic": "matching", "prune": False},
+                  {"name": "weighted", "search": "forward", "weight": 3,
+                   "heuristic": "matching", "prune": True},
+                  {"name": "nearest", "search": "forward", "weight": 1,
+                   "heuristic": "nearest", "prune": True},
+                  {"name": "greedy", "search": "forward", "weight": 10,
+                   "heuristic": "nearest", "prune": True})
+POLL_SECONDS = 0.1  # how often solve_portfolio looks for workers that died without a report
+JOIN_SECONDS = 5  # how long a stopped worker may take to exit before it is terminated
+
+
+class SharedTable(object):
+    """open addressing table of position keys and the fewest pushes a search expanded
+    them after, in memory shared by forked processes; it is not locked, a slot written
+    by two searches at once holds one of their entries or a lost one, which only costs
+    repeated work; only searches that skip nothing write it, so a position in it is
+    searched on by one of them"""
+    def __init__(self, capacity=1 << 20, probes=8):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.mask = size - 1
+        self.probes = probes
+        self.keys = multiprocessing.RawArray(ctypes.c_uint64, size)  # 0 is an empty slot
+        self.pushes = multiprocessing.RawArray(ctypes.c_uint32, size)
+
+    def record(self, key, pushes):
+        """records a position expanded after pushes, keeping the fewest pushes; a position
+        finding no free slot is not shared"""
+        keys, stored_pushes = self.keys, self.pushes
+        key = key or 1
+        slot = key & self.mask
+        for _ in range(self.probes):
+            stored = keys[slot]
+            if stored == key:
+                if pushes < stored_pushes[slot]:
+                    stored_pushes[slot] = pushes
+                return
+            if stored == 0:
+                stored_pushes[slot] = pushes
+                keys[slot] = key
+                return
+            slot = (slot + 1) & self.mask
+
+    def covers(self, key, pushes):
+        """check if a position was expanded after fewer pushes"""
+        keys, stored_pushes = self.keys, self.pushes
+        key = key or 1
+        slot = key & self.mask
+        for _ in range(self.probes):
+            stored = keys[slot]
+            if stored == key:
+                return stored_pushes[slot] < pushes
+            if stored == 0:
+                return False
+            slot = (slot + 1) & self.mask
+        return False
+
+
+def search(board, configuration, limits, table, stop, results=None):
+    """runs one configuration on the board, returns its report; a solution or a proof
+    that there is none sets stop, which cancels the other searches"""
+    solver = SEARCHES[configuration["search"]](board, limits["max nodes"], limits["timeout"],
+                                               configuration["weight"],
+                                               configuration["heuristic"])
+    solver.cancel = stop
+    solver.shared = table
+    solver.prune_shared = configuration["prune"]
+    started = time.time()
+    solution = solver.solve()
+    seconds = time.time() - started
+    # only a search skipping nothing proves that there is no solution, a pruning search
+    # that runs out of positions is just exhausted
+    exhausted = "exhausted" if configuration["prune"] else "unsolvable"
+    report = {"worker": configuration["name"],
+              "result": "solved" if solution is not None else solver.limit_reached or exhausted,
+              "solution": solution,
+              "nodes": solver.nodes,
+              "seconds": round(seconds, 4),
+              "nodes per second": round(solver.nodes / seconds, 1) if seconds else None}
+    if solution is not None or report["result"] == "unsolvable":
+        stop.set()
+    if results is not None:
+        results.put(report)
+    return report
+
+
+def solve_portfolio(board, workers=None, max_nodes=250000, timeout=None, table_size=1 << 20):
+    """solves the board's current position with up to one worker per configuration,
+    returns the first solution found, None if there is none, and the worker reports"""
+    workers = max(1, min(workers or multiprocessing.cpu_count(), len(CONFIGURATIONS)))
+    limits = {"max nodes": max_nodes, "timeout": timeout}
+    table = SharedTable(table_size)
+    stop = multiprocessing.Event()
+    if workers == 1:
+        report = search(board, CONFIGURATIONS[0], limits, table, stop)
+        return report["solution"], [report]
+
+    configurations = CONFIGURATIONS[:workers]
+    names = [configuration["name"] for configuration in configurations]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=search,
+                                         args=(board, configuration, limits, table, stop, results))
+                 for configuration in configurations]
+    reports = [None] * len(processes)
+    try:
+        for process in processes:
+            process.daemon = True
+            process.start()
+        silent = set()  # workers found dead with no report at the last poll
+        while None in reports:
+            try:
+                report = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                # a report put just before its worker exited may still be on its way,
+                # so a worker is given up on once a whole poll brought nothing
+                for number, process in enumerate(processes):
+                    if reports[number] is None and not process.is_alive():
+                        if number in silent:
+                            reports[number] = failed_report(names[number], process.exitcode)
+                        silent.add(number)
+                continue
+            reports[names.index(report["worker"])] = report
+    finally:
+        stop.set()
+        for process in processes:
+            if process.pid is None:
+                continue
+            process.join(JOIN_SECONDS)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+    solution = next((report["solution"] for report in reports
+                     if report["solution"] is not None), None)
+    return solution, reports
+
+
+def failed_report(name, exitcode):
+    """report of a worker that exited without sending its own"""
+    return {"worker": name,
+            "result": "failed",
+            "exit code": exitcode,
+            "solution": None,
+            "nodes": None,
+            "seconds": None,
+            "nodes per second": None}
+
+
+def main(arguments=None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="solve a level with parallel searches")
+    parser.add_argument("level_file")
+    parser.add_argument("level", type=int, help="level number, counted from 1")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="searches run at once, at most %d" % len(CONFIGURATIONS))
+    parser.add_argument("--timeout", type=float, help="seconds every search may take")
+    parser.add_argument("--max-nodes", type=int, default=250000,
+                        help="states every search may expand")
+    arguments = parser.parse_args(arguments)
+    levels = LevelReader().read_levels_file(arguments.level_file)
+    if levels is None:
+        parser.error("no such level file: %s" % arguments.level_file)
+    if not 1 <= arguments.level <= len(levels):
+        parser.error("the file has levels 1 to %d" % len(levels))
+    board = levels[arguments.level - 1][0].reset()
+    solution, reports = solve_portfolio(board, arguments.workers, arguments.max_nodes,
+                                        arguments.timeout)
+    for report in reports:
+        del report["solution"]
+    sys.stdout.write(json.dumps({"level": arguments.level,
+                                 "result": "solved" if solution is not None else "unsolved",
+                                 "solution": solution,
+                                 "workers": reports}, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""push-optimal search over the states of a board"""
+
+import heapq
+import time
+from collections import deque
+from itertools import count
+
+from puzzle.levels.compact import BOX_KEYS, PLAYER_KEYS
+from puzzle.levels.level import DIRECTIONS, LURD
+from puzzle.solver.goalrooms import find_goal_rooms
+
+INFINITY = 1 << 20
+
+
+class Solver(object):
+    """A* search over pushes; a state is the sorted tuple of box squares together with the
+    smallest square the player can walk to, so every player position between two pushes
+    collapses into one state; a weight above 1 trades push optimality for speed and the
+    "nearest" heuristic skips the matching of boxes to goals; with goal_rooms, pushes
+    leaving adjacent goals in a way they can never all be filled again are not made"""
+    def __init__(self, board, max_nodes=250000, time_limit=None, weight=1,
+                 heuristic="matching", goal_rooms=True):
+        self.max_nodes = max_nodes
+        # seconds a search may take, None for no limit; they count from here, so the
+        # preparation of the search is part of them
+        self.time_limit = time_limit
+        self.deadline = None if time_limit is None else time.time() + time_limit
+        self.weight = weight
+        self.heuristic = heuristic
+        self.nodes = 0
+        self.limit_reached = None  # "nodes", "time" or "cancelled" when a search gave up
+        self.cancel = None  # event set by another search to stop this one
+        # transposition table shared with other searches and whether to skip the states
+        # a search that skips nothing expanded with fewer pushes, instead of recording
+        self.shared = None
+        self.prune_shared = False
+
+        # squares are numbered line by line on the board surrounded by an extra wall border
+        self.stride = board.height + 2
+        self.size = (board.width + 2) * self.stride
+        self.walls = bytearray(b'\x01' * self.size)
+        for x_value in range(board.width):
+            for y_value in range(board.height):
+                if not board.is_wall((x_value, y_value)):
+                    self.walls[self.index((x_value, y_value))] = 0
+
+        self.letters = {}
+        for letter, name in LURD.items():
+            self.letters[self.offset(DIRECTIONS[name])] = letter
+        self.steps = tuple(self.letters)
+
+        self.player = self.index(board.player)
+        self.boxes = tuple(sorted(self.index(box) for box in board.boxes_list))
+        self.goals = tuple(sorted(self.index(goal) for goal in board.goal_list))
+        self.distances = [self.pull_distances(goal) for goal in self.goals]
+        self.nearest = [min(column) for column in zip(*self.distances)]
+        self.dead = bytearray(distance >= INFINITY for distance in self.nearest)
+        self.goal_squares = bytearray(self.size)
+        for goal in self.goals:
+            self.goal_squares[goal] = 1
+        self.examined = bytearray(self.size)  # boxes a freeze test is examining, as walls
+        self.estimates = {}  # box tuple -> lower bound, shared by all player regions
+        # box tuple -> (goal of every box, goal potentials) of its cheapest assignment, the
+        # start of the assignment of every state one push away
+        self.duals = {}
+        self.rooms = find_goal_rooms(self) if goal_rooms else []
+        self.room_of = [None] * self.size  # goal room of every square, if any
+        for room in self.rooms:
+            for square in room.squares:
+                self.room_of[square] = room
+
+    def index(self, position):
+        """square number of a board position"""
+        return (position[0] + 1) * self.stride + position[1] + 1
+
+    def position(self, square):
+        """board position of a square number"""
+        x_value, y_value = divmod(square, self.stride)
+        return x_value - 1, y_value - 1
+
+    def offset(self, direction):
+        """square number difference of a step in the given direction"""
+        return direction[0] * self.stride + direction[1]
+
+    def pull_distances(self, goal):
+        """least number of pushes bringing a box from each square to the goal, other boxes aside"""
+        distances = [INFINITY] * self.size
+        distances[goal] = 0
+        queue = deque([goal])
+        while queue:
+            square = queue.popleft()
+            for step in self.steps:
+                before = square - step
+                if distances[before] == INFINITY \
+                        and not self.walls[before] and not self.walls[before - step]:
+                    distances[before] = distances[square] + 1
+                    queue.append(before)
+        return distances
+
+    def reach(self, player, boxes):
+        """marks squares the player walks to without pushing with 2, walls and boxes with 1,
+        returns the marks with the smallest reachable square"""
+        marks = bytearray(self.walls)
+        for box in boxes:
+            marks[box] = 1
+        marks[player] = 2
+        lowest = player
+        stack = [player]
+        steps = self.steps
+        while stack:
+            square = stack.pop()
+            for step in steps:
+                near = square + step
+                if not marks[near]:
+                    marks[near] = 2
+                    stack.append(near)
+                    if near < lowest:
+                        lowest = near
+        return marks, lowest
+
+    def is_deadlock(self, marks, box):
+        """check the freeze and 2x2 patterns of Map.is_deadlock around a box that was just
+        pushed off the goals, in marks holding 1 for walls and boxes"""
+        for across in (-1, 1):
+            for along in (-self.stride, self.stride):
+                if marks[box + across] == 1 and marks[box + along] == 1 \
+                        and marks[box + across + along] == 1:
+                    return True
+        return self.is_frozen(marks, box)
+
+    def is_frozen(self, marks, box):
+        """check if the box can move along neither axis, for walls, dead squares on both
+        sides or other frozen boxes; the boxes being examined count as walls"""
+        walls, dead, examined = self.walls, self.dead, self.examined
+        examined[box] = 1
+        frozen = True
+        for step in (1, self.stride):
+            before, after = box - step, box + step
+            if walls[before] or walls[after] or examined[before] or examined[after] \
+                    or dead[before] and dead[after]:
+                continue
+            if not (marks[before] == 1 and self.is_frozen(marks, before)
+                    or marks[after] == 1 and self.is_frozen(marks, after)):
+                frozen = False
+                break
+        examined[box] = 0
+        return frozen
+
+    def estimate(self, boxes, parent=None, push=None):
+        """lower bound of the pushes left: cost of the cheapest assignment of boxes to goals;
+        given the boxes of the parent state and the (box, step) push leading here, the
+        parent's assignment is repaired instead of made anew"""
+        if boxes in self.estimates:
+            return self.estimates[boxes]
+        total = 0
+        nearest = []
+        for box in boxes:
+            best = INFINITY
+            for number, distances in enumerate(self.distances):
+                if distances[box] < best:
+                    best = distances[box]
+                    goal = number
+            if best >= INFINITY:
+                return INFINITY
+            total += best
+            nearest.append(goal)
+        if self.heuristic == "matching":
+            if len(set(nearest)) == len(boxes):
+                # every box has a goal of its own, potentials of 0 make this optimal
+                self.duals[boxes] = (tuple(nearest), (0,) * len(boxes))
+            else:
+                total = self.matching(boxes, parent, push)
+        self.estimates[boxes] = total
+        return total
+
+    def matching(self, boxes, parent=None, push=None):
+        """minimum cost perfect matching of boxes to goals (hungarian method); if the
+        parent's boxes were matched, only the row of the pushed box is assigned again"""
+        size = len(boxes)
+        cost = [[distances[box] for distances in self.distances] for box in boxes]
+        row_potential = [0] * (size + 1)
+        column_potential = [0] * (size + 1)
+        assigned = [0] * (size + 1)  # row of every column, 0 for none
+        way = [0] * (size + 1)
+        rows = range(1, size + 1)
+        if parent in self.duals and push is not None:
+            # the other rows keep their goals, and their potentials follow from the goal
+            # potentials as their assignments are tight
+            goals, potentials = self.duals[parent]
+            goal_of = dict(zip(parent, goals))
+            column_potential[1:] = potentials
+            target = push[0] + push[1]
+            for row, box in enumerate(boxes, 1):
+                if box == target:
+                    rows = [row]
+                else:
+                    column = goal_of[box] + 1
+                    assigned[column] = row
+                    row_potential[row] = cost[row - 1][column - 1] - column_potential[column]
+        for row in rows:
+            assigned[0] = row
+            column = 0
+            lowest = [float('inf')] * (size + 1)
+            used = [False] * (size + 1)
+            while assigned[column]:
+                used[column] = True
+                current_row = assigned[column]
+                delta = float('inf')
+                next_column = 0
+                for other in range(1, size + 1):
+                    if not used[other]:
+                        reduced = cost[current_row - 1][other - 1] \
+                            - row_potential[current_row] - column_potential[other]
+                        if reduced < lowest[other]:
+                            lowest[other] = reduced
+                            way[other] = column
+                        if lowest[other] < delta:
+                            delta = lowest[other]
+                            next_column = other
+                for other in range(size + 1):
+                    if used[other]:
+                        row_potential[assigned[other]] += delta
+                        column_potential[other] -= delta
+                    else:
+                        lowest[other] -= delta
+                column = next_column
+            while column:
+                previous = way[column]
+                assigned[column] = assigned[previous]
+                column = previous
+        goals = [0] * size
+        for column in range(1, size + 1):
+            goals[assigned[column] - 1] = column - 1
+        self.duals[boxes] = (tuple(goals), tuple(column_potential[1:]))
+        total = sum(cost[row][goals[row]] for row in range(size))
+        return min(total, INFINITY)
+
+    def successors(self, boxes, marks):
+        """yields (sorted boxes, pushed box, step, target) of every push the player, who
+        walks to the squares marked 2, can make without an obvious deadlock"""
+        dead, goal_squares, room_of = self.dead, self.goal_squares, self.room_of
+        for number, box in enumerate(boxes):
+            for step in self.steps:
+                target = box + step
+                if marks[box - step] != 2 or marks[target] == 1 or dead[target]:
+                    continue
+                moved = list(boxes)
+                moved[number] = target
+                if not goal_squares[target]:
+                    # the marks of the position after the push, put back after the test
+                    mark = marks[target]
+                    marks[box], marks[target] = 2, 1
+                    deadlock = self.is_deadlock(marks, target)
+                    marks[box], marks[target] = 1, mark
+                    if deadlock:
+                        continue
+                room = room_of[target] or room_of[box]
+                if room is not None and not room.allows(moved):
+                    continue
+                yield tuple(sorted(moved)), box, step, target
+
+    @staticmethod
+    def state_key(state):
+        """zobrist hash of a state, the same as Board.position_key of its position"""
+        boxes, lowest = state
+        key = PLAYER_KEYS[lowest]
+        for box in boxes:
+            key ^= BOX_KEYS[box]
+        return key
+
+    def out_of_time(self):
+        """check if the deadline has passed or another search cancelled this one, setting
+        limit_reached if so"""
+        if self.deadline is not None and time.time() > self.deadline:
+            self.limit_reached = "time"
+        elif self.cancel is not None and self.cancel.is_set():
+            self.limit_reached = "cancelled"
+        return self.limit_reached is not None
+
+    def solve(self):
+        """returns a push-optimal LURD string for the board, None when there is no solution
+        or none was found within max_nodes expanded states and time_limit seconds"""
+        self.limit_reached = None
+        if len(self.boxes) != len(self.goals):
+            return None
+        estimate = self.estimate(self.boxes)
+        if estimate >= INFINITY:
+            return None
+
+        # children are queued with the cheap per-box bound; the matching bound is only
+        # computed for states that reach the front of the queue
+        tie_breaker = count()
+        weight = self.weight
+        queue = [(weight * estimate, 0, next(tie_breaker), self.boxes, self.player, None, None,
+                  True)]
+        closed = {}  # transposition table: state -> (parent state, pushed box, step)
+        nearest = self.nearest
+        self.nodes = 0
+        while queue:
+            if self.out_of_time():
+                return None
+            entry = heapq.heappop(queue)
+            cost, pushes, _, boxes, player, parent, push, exact = entry
+            if not exact:
+                estimate = self.estimate(boxes, parent[0], push)
+                if estimate >= INFINITY:
+                    continue
+                if weight * estimate - pushes > cost:
+                    heapq.heappush(queue, (weight * estimate - pushes,) + entry[1:-1] + (True,))
+                    continue
+            marks, lowest = self.reach(player, boxes)
+            state = (boxes, lowest)
+            if state in closed:
+                continue
+            if self.shared is not None:
+                if not self.prune_shared:
+                    self.shared.record(self.state_key(state), -pushes)
+                elif self.shared.covers(self.state_key(state), -pushes):
+                    continue
+            closed[state] = (parent, push)
+            if boxes == self.goals:
+                return self.moves(self.pushes(closed, state))
+
+            self.nodes += 1
+            if self.nodes > self.max_nodes:
+                self.limit_reached = "nodes"
+                return None
+
+            pushes -= 1  # stored negated, so deeper states win ties
+            bound = weight * sum(nearest[box] for box in boxes) - pushes
+            for moved, box, step, target in self.successors(boxes, marks):
+                priority = bound + weight * (nearest[target] - nearest[box])
+                heapq.heappush(queue, (priority, pushes, next(tie_breaker),
+                                       moved, box, state, (box, step), False))
+        return None
+
+    @staticmethod
+    def pushes(closed, state):
+        """follows the transposition table back to the start, returns the pushes in order"""
+        pushes = []
+        parent, push = closed[state]
+        while parent is not None:
+            pushes.append(push)
+            parent, push = closed[parent]
+        pushes.reverse()
+        return pushes
+
+    def moves(self, pushes):
+        """turns (box, step) pushes into a LURD string with walking moves in between"""
+        player = self.player
+        boxes = set(self.boxes)
+        letters = []
+        for box, step in pushes:
+            letters.extend(self.walk(player, box - step, boxes))
+            letters.append(self.letters[step].upper())
+            boxes.remove(box)
+            boxes.add(box + step)
+            player = box
+        return ''.join(letters)
+
+    def walk(self, source, target, boxes):
+        """shortest LURD walk between two squares, going around boxes"""
+        came_from = {source: None}
+        queue = deque([source])
+        while queue and target not in came_from:
+            square = queue.popleft()
+            for step in self.steps:
+                near = square + step
+                if near not in came_from and not self.walls[near] and near not in boxes:
+                    came_from[near] = step
+                    queue.append(near)
+        letters = []
+        while target != source:
+            step = came_from[target]
+            letters.append(self.letters[step])
+            target -= step
+        letters.reverse()
+        return letters
+
+
+def solve(board, max_nodes=250000, time_limit=30):
+    """shortcut returning a LURD solution of the board's current position or None, giving
+    up after time_limit seconds unless it is None"""
+    return Solver(board, max_nodes, time_limit).solve()
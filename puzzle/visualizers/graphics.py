@@ -1,26 +1,62 @@
 """the Graphics class delivers all graphics for Window class"""
 
+from collections import OrderedDict
+import threading
 import pygame
 import os
 
+# images of the map's tile characters and decorations
+TILE_IMAGES = {'x': 'corner', '#': 'wall', 'o': 'inside floor', ' ': 'outside floor'}
+DECORATION_IMAGES = {'1': 'rock', '2': 'short tree', '3': 'tall tree', '4': 'ugly tree'}
+# images drawn in the size of a tile, the others are screens and banners
+TILE_SIZED_IMAGES = ('uncovered goal', 'covered goal', 'star', 'corner', 'wall',
+                     'inside floor', 'outside floor', 'boy', 'rock', 'short tree',
+                     'tall tree', 'ugly tree')
+# held while the display is replaced and while a surface is converted to its pixel
+# format, levels are prepared in a background thread as the main thread opens screens
+DISPLAY_LOCK = threading.RLock()
+
+
+def converted(surface, alpha=False):
+    """the surface in the display's pixel format, with per pixel alpha if asked, or the
+    surface itself while there is no display"""
+    with DISPLAY_LOCK:
+        if pygame.display.get_surface() is None:
+            return surface
+        return surface.convert_alpha() if alpha else surface.convert()
+
 
 class Graphics(object):
-    """the Window class depends on Graphics for all colors and images"""
+    """the Window class depends on Graphics for all colors and images, which are
+    loaded when they are first used so the window can show text before that"""
     def __init__(self):
-        pygame.init()
+        pygame.font.init()  # the rest of pygame is initialized by the window
 
         self.colors = self.get_colors()
         self.basic_font = pygame.font.SysFont('comicsansms', 22)
         self.image_paths = self.get_all_images()
         self.images_dictionary = self.get_images_dictionary()
-        self.tile_mapping = self.get_tiles()
-        self.decoration_mapping = self.get_decorations()
-        self.player_image = self.get_player()
+        self.atlas = TileAtlas(self)
+
+    @property
+    def tile_mapping(self):
+        """tile images by map character"""
+        return self.get_tiles()
+
+    @property
+    def decoration_mapping(self):
+        """decoration images by map character"""
+        return self.get_decorations()
+
+    @property
+    def player_image(self):
+        """image of the player"""
+        return self.get_player()
 
     @staticmethod
     def path_of(file_name):
-        """creates a proper file path"""
-        return os.path.join('visualizers', 'images', file_name)
+        """creates a proper file path, next to this module whatever the working directory"""
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images', file_name)
 
     @staticmethod
     def get_colors():
@@ -48,38 +84,82 @@ class Graphics(object):
                 'error': self.path_of('error.png'),
                 'win': self.path_of('win.png')}
 
+    @staticmethod
+    def load(path):
+        """loads an image, converted to the display's pixel format once there is a display
+        so blitting it needs no conversion"""
+        return converted(pygame.image.load(path), alpha=True)
+
     def get_images_dictionary(self):
-        """creates a ready image dictionary"""
-        return {'uncovered goal': pygame.image.load(self.image_paths['uncovered goal']),
-                'covered goal': pygame.image.load(self.image_paths['covered goal']),
-                'star': pygame.image.load(self.image_paths['star']),
-                'corner': pygame.image.load(self.image_paths['corner']),
-                'wall': pygame.image.load(self.image_paths['wall']),
-                'inside floor': pygame.image.load(self.image_paths['inside floor']),
-                'outside floor': pygame.image.load(self.image_paths['outside floor']),
-                'title': pygame.image.load(self.image_paths['title']),
-                'boy': pygame.image.load(self.image_paths['boy']),
-                'rock': pygame.image.load(self.image_paths['rock']),
-                'short tree': pygame.image.load(self.image_paths['short tree']),
-                'tall tree': pygame.image.load(self.image_paths['tall tree']),
-                'ugly tree': pygame.image.load(self.image_paths['ugly tree']),
-                'error': pygame.image.load(self.image_paths['error']),
-                'win': pygame.image.load(self.image_paths['win'])}
+        """creates an image dictionary loading every image on first use"""
+        return LazyImages(self.image_paths, self.load)
 
     def get_tiles(self):
         """creates a tile dictionary"""
-        return {'x': self.images_dictionary['corner'],
-                '#': self.images_dictionary['wall'],
-                'o': self.images_dictionary['inside floor'],
-                ' ': self.images_dictionary['outside floor']}
+        return dict((tile, self.images_dictionary[name]) for tile, name in TILE_IMAGES.items())
 
     def get_decorations(self):
         """creates a decorations dictionary"""
-        return {'1': self.images_dictionary['rock'],
-                '2': self.images_dictionary['short tree'],
-                '3': self.images_dictionary['tall tree'],
-                '4': self.images_dictionary['ugly tree']}
+        return dict((tile, self.images_dictionary[name])
+                    for tile, name in DECORATION_IMAGES.items())
 
     def get_player(self):
         """returns player image"""
         return self.images_dictionary['boy']
+
+
+class LazyImages(dict):
+    """images by name, each loaded when it is first looked up"""
+    def __init__(self, paths, load):
+        dict.__init__(self)
+        self.paths = paths
+        self.load = load
+        self.lock = threading.Lock()  # tiles may be scaled in a background thread
+
+    def __missing__(self, name):
+        with self.lock:
+            if not dict.__contains__(self, name):
+                self[name] = self.load(self.paths[name])
+            return dict.__getitem__(self, name)
+
+
+class TileAtlas(object):
+    """the tile sized images scaled to the tile sizes on screen, the sizes used most
+    recently are kept so drawing a level is a series of same size blits"""
+    def __init__(self, graphics, capacity=8):
+        self.graphics = graphics
+        self.capacity = capacity
+        self.scaled = OrderedDict()
+        self.lock = threading.Lock()  # levels may be prepared in a background thread
+
+    def tiles(self, size):
+        """the images scaled to size, scaled now if the size is not cached"""
+        with self.lock:
+            if size in self.scaled:
+                tiles = self.scaled.pop(size)
+            else:
+                tiles = ScaledTiles(self.graphics, size)
+                if len(self.scaled) >= self.capacity:
+                    self.scaled.popitem(last=False)
+            self.scaled[size] = tiles
+            return tiles
+
+
+class ScaledTiles(object):
+    """tile, decoration and object images of one size, named like those of Graphics"""
+    def __init__(self, graphics, size):
+        self.size = size
+        self.images_dictionary = dict((name, self.scale(graphics.images_dictionary[name], size))
+                                      for name in TILE_SIZED_IMAGES)
+        self.tile_mapping = dict((tile, self.images_dictionary[name])
+                                 for tile, name in TILE_IMAGES.items())
+        self.decoration_mapping = dict((tile, self.images_dictionary[name])
+                                       for tile, name in DECORATION_IMAGES.items())
+        self.player_image = self.images_dictionary['boy']
+
+    @staticmethod
+    def scale(image, size):
+        """image scaled to size, the image itself if it has that size"""
+        if image.get_size() == size:
+            return image
+        return pygame.transform.scale(image, size)
@@ -0,0 +1,156 @@
+"""level rendering over a cached static layer of pre-scaled tiles"""
+
+import math
+
+import pygame
+
+from puzzle.visualizers.graphics import converted
+
+# "top" is where the upper face of a floor tile starts within its image
+TILE_SIZE = {"width": 50, "height": 85, "floor": 40, "top": 25}
+
+
+def fitted_size(width, height, background_width, background_height):
+    """size of a surface shrunk to fit the background, keeping its proportions"""
+    if height > background_height:
+        width = width * background_height // height
+        height = background_height
+    if width > background_width:
+        height = height * background_width // width
+        width = background_width
+    return width, height
+
+
+class LevelRenderer(object):
+    """draws a board over a layer of floor, walls and decorations that is built once
+    from tiles of the final size, so a move only repaints the tiles it changed"""
+    def __init__(self, graphics, level, background_width, background_height):
+        self.dicts = graphics
+        self.level = level
+        self.map_grid = level.map_grid
+        self.background = (background_width, background_height)
+
+        base_width = level.width * TILE_SIZE["width"]
+        base_height = level.height * TILE_SIZE["floor"] + TILE_SIZE["height"]
+        self.width, self.height = fitted_size(base_width, base_height,
+                                              background_width, background_height)
+        self.scale_x = float(self.width) / base_width
+        self.scale_y = float(self.height) / base_height
+        # rounded up, so tiles placed at rounded down positions leave no gaps
+        self.tile_width = int(math.ceil(TILE_SIZE["width"] * self.scale_x))
+        self.tile_height = int(math.ceil(TILE_SIZE["height"] * self.scale_y))
+
+        self.tiles = graphics.atlas.tiles((self.tile_width, self.tile_height))
+        self.static_layer = self.draw_static_layer()
+        self.rectangle = self.static_layer.get_rect()
+
+    def is_current(self, level, background_width, background_height):
+        """check if the cached layer still belongs to the level's map and the background"""
+        return level is self.level and level.map_grid is self.map_grid \
+            and self.background == (background_width, background_height)
+
+    def draw_static_layer(self):
+        """draws floor, walls and decorations with tiles already scaled to the final size"""
+        map_surface = converted(pygame.Surface((self.width, self.height)))
+        map_surface.fill(self.dicts.colors["light green"])
+
+        tiles = self.tiles
+        for x_value in range(self.level.width):
+            for y_value in range(self.level.height):
+                tile = self.map_grid.get_tile((x_value, y_value))
+                rectangle = self.tile_rectangle((x_value, y_value))
+                if tile in tiles.tile_mapping:
+                    map_surface.blit(tiles.tile_mapping[tile], rectangle)
+                elif tile in tiles.decoration_mapping:
+                    map_surface.blit(tiles.tile_mapping[' '], rectangle)
+                    map_surface.blit(tiles.decoration_mapping[tile], rectangle)
+        return map_surface
+
+    def tile_rectangle(self, position):
+        """area covered by the image of a tile on the scaled layer"""
+        return pygame.Rect((int(position[0] * TILE_SIZE["width"] * self.scale_x),
+                            int(position[1] * TILE_SIZE["floor"] * self.scale_y),
+                            self.tile_width, self.tile_height))
+
+    def tile_at(self, point):
+        """board position whose upper face is under a display point, None off the board"""
+        x_value = (point[0] - self.rectangle.left) / (TILE_SIZE["width"] * self.scale_x)
+        y_value = (point[1] - self.rectangle.top - TILE_SIZE["top"] * self.scale_y) \
+            / (TILE_SIZE["floor"] * self.scale_y)
+        position = (int(math.floor(x_value)), int(math.floor(y_value)))
+        if self.level.is_inside(position):
+            return position
+        return None
+
+    def draw_objects(self, surface, position, offset):
+        """draws goal, box and player images of a tile"""
+        level = self.level
+        images = self.tiles.images_dictionary
+        rectangle = self.tile_rectangle(position).move(offset)
+        if level.has_box(position):
+            if level.has_goal(position):
+                surface.blit(images['covered goal'], rectangle)
+            surface.blit(images['star'], rectangle)
+        elif level.has_goal(position):
+            surface.blit(images['uncovered goal'], rectangle)
+        if position == level.player:
+            surface.blit(self.tiles.player_image, rectangle)
+
+    def draw(self):
+        """returns a new surface with the whole level"""
+        level_surface = self.static_layer.copy()
+        positions = set(self.level.boxes_list)
+        positions.update(self.level.goal_list)
+        positions.add(self.level.player)
+        for position in sorted(positions):
+            self.draw_objects(level_surface, position, (0, 0))
+
+        if self.level.is_finished():
+            win_image = self.dicts.images_dictionary["win"]
+            win_size = fitted_size(int(win_image.get_width() * self.scale_x),
+                                   int(win_image.get_height() * self.scale_y),
+                                   self.width, self.height)
+            win_image = pygame.transform.scale(win_image, win_size)
+            rectangle = win_image.get_rect()
+            rectangle.top = int(20 * self.scale_y)
+            rectangle.centerx = self.width // 2
+            level_surface.blit(win_image, rectangle)
+        return level_surface
+
+    def update(self, display, positions):
+        """repaints the given tiles on the display where the level was drawn at
+        self.rectangle, returns the changed display areas"""
+        offset = self.rectangle.topleft
+        dirty_rectangles = []
+        for position in set(positions):
+            area = self.tile_rectangle(position)
+            screen_area = area.move(offset)
+            display.set_clip(screen_area)
+            display.blit(self.static_layer, screen_area, area)
+            # images are taller than the floor, so two tiles on each side overlap this
+            # one; after rounding, tiles of the neighbouring columns may overlap it too
+            for x_value in range(position[0] - 1, position[0] + 2):
+                for y_value in range(position[1] - 2, position[1] + 3):
+                    self.draw_objects(display, (x_value, y_value), offset)
+            dirty_rectangles.append(screen_area)
+        display.set_clip(None)
+        return dirty_rectangles
+
+
+class MirroredRenderer(LevelRenderer):
+    """renderer of a mirrored board, whose static layer is the original board's layer
+    flipped instead of drawn again"""
+    def __init__(self, original, level):
+        self.original = original
+        LevelRenderer.__init__(self, original.dicts, level, *original.background)
+
+    def draw_static_layer(self):
+        """the original's static layer, flipped horizontally"""
+        return pygame.transform.flip(self.original.static_layer, True, False)
+
+    def tile_rectangle(self, position):
+        """the flipped area of the original's tile at the mirrored position"""
+        rectangle = LevelRenderer.tile_rectangle(self, (self.level.width - 1 - position[0],
+                                                        position[1]))
+        rectangle.left = self.width - rectangle.right
+        return rectangle
@@ -1,10 +1,22 @@
 """this is the advanced graphics module"""
 
 import puzzle.visualizers.graphics as graphics
+from puzzle.visualizers.renderer import LevelRenderer, MirroredRenderer
+from puzzle import profiling
+from collections import deque
 import pygame
 import pygame.locals as key
+import os
+import time
 
 
+# events the player reacts to, nothing else can change the game
+INPUT_EVENTS = (key.QUIT, key.KEYDOWN, key.MOUSEBUTTONDOWN, key.MOUSEBUTTONUP)
+# events after which the window has to be drawn again, e.g. once it was covered
+REDRAW_EVENTS = (key.VIDEOEXPOSE, key.ACTIVEEVENT, key.VIDEORESIZE)
+# events that wake the loop
+WAKING_EVENTS = INPUT_EVENTS + REDRAW_EVENTS
+
 KEYS = {"left_A": "left", "right_A": "right",
         "up_A": "up", "down_A": "down",
         "left_B": "left", "right_B": "right",
@@ -13,11 +25,33 @@ KEYS = {"left_A": "left", "right_A": "right",
 
 class Window(object):
     """window graphics and logic"""
-    def __init__(self):
+    def __init__(self, fps=0, size=None):
         pygame.init()
-
-        self.window_width = pygame.display.list_modes(32)[0][0]
-        self.window_height = pygame.display.list_modes(32)[0][1]
+        # no other event changes the game or the display, so no other event wakes the loop
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(list(WAKING_EVENTS))
+
+        # 0 blocks until the next event, otherwise events are polled at most fps times a second
+        self.fps = fps
+        self.clock = pygame.time.Clock()
+        self.stats = {"frames": 0,
+                      "frame time": 0.0,
+                      "longest frame": 0.0,
+                      "idle time": 0.0,
+                      "idle cpu": 0.0}
+        self.frame_start = None
+        # while profiling, frames are timed and the frame rate is shown in a corner
+        self.profile = profiling.PROFILE
+        self.frame_ends = deque(maxlen=30)
+        self.overlay_area = None
+        if self.profile is not None:
+            self.profile.sources["window"] = self.statistics
+
+        # size opens a window of that size instead of the full screen
+        self.fullscreen = size is None
+        if self.fullscreen:
+            size = pygame.display.list_modes(32)[0]
+        self.window_width, self.window_height = size
         self.surface_display = self.new_surface()
         self.dicts = graphics.Graphics()
 
@@ -29,19 +63,51 @@ class Window(object):
                          "solo": self.display_solo_game,
                          "freeze": self.freeze,
                          "dual": self.display_dual_game,
-                         "reload": self.reload_game}
+                         "reload": self.reload_game,
+                         "undo": self.undo_move,
+                         "redo": self.redo_move,
+                         "restart": self.restart_level,
+                         "grab": self.grab_tile,
+                         "drop": self.drop_tile}
         self.mode = "solo"
         self.level = None
 
+        # "incremental" repaints only the tiles a move changed, "full" redraws the level
+        self.render_mode = "incremental"
+        self.renderer = None
+        self.dual_renderers = None  # of the board and of its mirror in the dual game
+
+        self.event = None  # the event that woke the loop last
+        self.grabbed = None  # tile under the mouse when its button went down
+        # steps per second of walks the player clicked, 0 shows only where they end
+        self.walk_speed = 30
+
+    def show_level(self, level, renderers=None):
+        """switches to a level, with its solo and dual renderers if they were prepared
+        in advance"""
+        self.level = level
+        if renderers is not None:
+            self.renderer, self.dual_renderers = renderers
+
+    def prepare_level(self, level):
+        """draws the static layers of a level's solo and dual boards in advance; it may be
+        called from another thread, as the surfaces are converted to the display's pixel
+        format under graphics.DISPLAY_LOCK, which new_surface holds too"""
+        solo = LevelRenderer(self.dicts, level[0], self.window_width - 20, self.window_height - 20)
+        return solo, self.new_dual_renderers(level)
+
     def reset_level(self):
         """returns level to starting state"""
-        self.level = (self.level[0].reset(), self.level[0].mirror())
+        self.level = (self.level[0].reset(), self.level[1].reset())
 
     def new_surface(self):
-        """creates new display"""
-        # return pygame.display.set_mode((self.window_width, self.window_height))
-        return pygame.display.set_mode((self.window_width, self.window_height),
-                                       pygame.FULLSCREEN, 32)
+        """creates new display, never while a level is being prepared in the background
+        converts a surface to the display's format"""
+        with graphics.DISPLAY_LOCK:
+            if not self.fullscreen:
+                return pygame.display.set_mode((self.window_width, self.window_height))
+            return pygame.display.set_mode((self.window_width, self.window_height),
+                                           pygame.FULLSCREEN, 32)
 
     def display(self, command):
         """respond to players command"""
@@ -76,13 +142,77 @@ class Window(object):
         self.surface_display.blit(self.dicts.images_dictionary[picture], rectangle)
         return top_coordinates
 
-    @staticmethod
-    def loop(command):
+    def loop(self, command):
         """maintain state until event"""
-        while True:
-            for event in pygame.event.get():
-                if event.type == key.QUIT or event.type == key.KEYDOWN:
-                    return command, event
+        self.count_frame()
+        if self.profile is not None:
+            self.draw_overlay()
+        wall_clock, cpu_clock = time.time(), self.cpu_time()
+        event = self.next_event()
+        while event.type not in INPUT_EVENTS:
+            if event.type in REDRAW_EVENTS:
+                # the display surface still holds the whole picture, only the screen lost it
+                pygame.display.update()
+            event = self.next_event()
+        self.event = event
+        self.frame_start = time.time()
+        self.stats["idle time"] += self.frame_start - wall_clock
+        self.stats["idle cpu"] += self.cpu_time() - cpu_clock
+        return command, event
+
+    def next_event(self):
+        """waits for the next event, pacing the polling with the clock if fps is set"""
+        if not self.fps:
+            return pygame.event.wait()
+        event = pygame.event.poll()
+        while event.type == key.NOEVENT:
+            self.clock.tick(self.fps)
+            event = pygame.event.poll()
+        return event
+
+    def count_frame(self):
+        """adds the time spent on the last event, from its arrival to this loop, to the stats"""
+        if self.frame_start is not None:
+            frame_time = time.time() - self.frame_start
+            self.stats["frames"] += 1
+            self.stats["frame time"] += frame_time
+            self.stats["longest frame"] = max(self.stats["longest frame"], frame_time)
+            if self.profile is not None:
+                self.profile.timer("frame").record(frame_time)
+                self.frame_ends.append(time.time())
+
+    def draw_overlay(self):
+        """shows the frame rate and frame times of the recent frames in the top left corner"""
+        frames = len(self.frame_ends) - 1
+        if frames < 1:
+            return
+        frame_timer = self.profile.timer("frame")
+        text = "%.1f fps   frame %.1f ms   mean %.1f ms   longest %.1f ms" % (
+            frames / max(self.frame_ends[-1] - self.frame_ends[0], 1e-9),
+            (self.frame_ends[-1] - self.frame_start) * 1000,
+            frame_timer.total / frame_timer.count * 1000,
+            frame_timer.longest * 1000)
+        text_surface = self.dicts.basic_font.render(text, 1, self.dicts.colors["white"])
+        area = text_surface.get_rect()
+        area.topleft = (5, 5)
+        dirty_area = area.union(self.overlay_area) if self.overlay_area else area
+        self.surface_display.fill(self.dicts.colors["dark green"], dirty_area)
+        self.surface_display.blit(text_surface, area)
+        pygame.display.update(dirty_area)
+        self.overlay_area = area
+
+    @staticmethod
+    def cpu_time():
+        """processor time used by the process so far"""
+        times = os.times()
+        return times[0] + times[1]
+
+    def statistics(self):
+        """the loop counters with average frame time and share of idle time spent on the cpu"""
+        statistics = dict(self.stats)
+        statistics["average frame"] = self.stats["frame time"] / max(self.stats["frames"], 1)
+        statistics["idle cpu share"] = self.stats["idle cpu"] / max(self.stats["idle time"], 1e-9)
+        return statistics
 
     def freeze(self):
         """maintain state"""
@@ -104,6 +234,8 @@ class Window(object):
                         'S - starts solo game, D - starts dual game',
                         'WASD - Player 1 move, Arrow keys - Player 2 move',
                         'Backspace - reset level, Esc - quit.',
+                        'U - undo, R - redo, Home - restart solo game.',
+                        'Click to walk, drag a star to push it there.',
                         'N - next level, B - go back a level.']
 
         pygame.display.set_caption('SOKOBAN')
@@ -143,14 +275,18 @@ class Window(object):
             level_a = self.level[0]
             level_b = self.level[1]
 
-            width = (self.window_width-30)/2
+            width = (self.window_width-30)//2
             height = self.window_height-20
             self.surface_display.fill(self.dicts.colors["green"])
-            surface_a = self.draw_level(level_a, width, height)
+            if self.render_mode == "incremental":
+                renderers = self.dual_renderer()
+                surface_a, surface_b = renderers[0].draw(), renderers[1].draw()
+            else:
+                surface_a = self.draw_level(level_a, width, height)
+                surface_b = self.draw_level(level_b, width, height)
             rectangle_a = surface_a.get_rect()
             rectangle_a.center = (self.window_width/4, self.window_height/2)
 
-            surface_b = self.draw_level(level_b, width, height)
             rectangle_b = surface_b.get_rect()
             rectangle_b.center = (0.75 * self.window_width, self.window_height/2)
 
@@ -162,6 +298,8 @@ class Window(object):
             self.surface_display.blit(surface_a, rectangle_a)
             self.surface_display.blit(surface_b, rectangle_b)
             self.surface_display.blit(divide, line)
+            if self.render_mode == "incremental":
+                renderers[0].rectangle, renderers[1].rectangle = rectangle_a, rectangle_b
             pygame.display.update()
 
         if level_a.is_finished() or level_b.is_finished():
@@ -176,11 +314,16 @@ class Window(object):
             return self.display_error_screen()
         else:
             self.surface_display.fill(self.dicts.colors["green"])
-            level_surface = self.draw_level(self.level[0],
-                                            self.window_width - 20, self.window_height - 20)
+            if self.render_mode == "incremental":
+                level_surface = self.solo_renderer().draw()
+            else:
+                level_surface = self.draw_level(self.level[0],
+                                                self.window_width - 20, self.window_height - 20)
             rectangle = level_surface.get_rect()
             rectangle.center = (self.window_width/2, self.window_height/2)
             self.surface_display.blit(level_surface, rectangle)
+            if self.render_mode == "incremental":
+                self.renderer.rectangle = rectangle
             pygame.display.update()
 
         if self.level[0].is_finished():
@@ -188,79 +331,172 @@ class Window(object):
 
         return self.loop("solo")
 
-    def draw_level(self, level, background_width, background_height):
-        """draws level from the board"""
-        tile_size = {"width": 50, "height": 85, "floor": 40}
-
-        surface_width = level.width * tile_size["width"]
-        surface_height = level.height * tile_size["floor"] + tile_size["height"]
-
-        map_surface = pygame.Surface((surface_width, surface_height))
-        map_surface.fill(self.dicts.colors["light green"])
-
-        for x_value in range(level.width):
-            for y_value in range(level.height):
-                position = (x_value, y_value)
-                tile = level.map_grid.get_tile(position)
-                rectangle = pygame.Rect((x_value * tile_size["width"],
-                                         y_value * tile_size["floor"],
-                                         tile_size["width"], tile_size["height"]))
-
-                if tile in self.dicts.tile_mapping:
-                    map_surface.blit(self.dicts.tile_mapping[tile], rectangle)
-                elif tile in self.dicts.decoration_mapping:
-                    map_surface.blit(self.dicts.tile_mapping[' '], rectangle)
-
-                if tile in self.dicts.decoration_mapping:
-                    map_surface.blit(self.dicts.decoration_mapping[tile], rectangle)
-                elif position in level.boxes_list:
-                    if position in level.goal_list:
-                        map_surface.blit(self.dicts.images_dictionary['covered goal'], rectangle)
-                    map_surface.blit(self.dicts.images_dictionary['star'], rectangle)
-                elif position in level.goal_list:
-                    map_surface.blit(self.dicts.images_dictionary['uncovered goal'], rectangle)
-
-                if position == level.player:
-                    map_surface.blit(self.dicts.player_image, rectangle)
-
-        if level.is_finished():
-            win_image = self.dicts.images_dictionary["win"]
-            if win_image.get_rect().width > surface_width:
-                win_image = pygame.transform.scale(win_image,
-                                                   (surface_width, win_image.get_rect().height))
-            rectangle = win_image.get_rect()
-            rectangle.top = 20
-            rectangle.centerx = surface_width / 2
-            map_surface.blit(win_image, rectangle)
-
-        return self.resize_surface(map_surface, background_width, background_height)
+    def dual_renderer(self):
+        """renderers of the dual game's boards, rebuilt when a board or its map changes"""
+        width, height = (self.window_width - 30) // 2, self.window_height - 20
+        renderers = self.dual_renderers
+        if renderers is None or not renderers[0].is_current(self.level[0], width, height) \
+                or not renderers[1].is_current(self.level[1], width, height):
+            self.dual_renderers = self.new_dual_renderers(self.level)
+        return self.dual_renderers
+
+    def new_dual_renderers(self, level):
+        """renderers of a level's board and of its mirror, which flips the board's layer"""
+        width, height = (self.window_width - 30) // 2, self.window_height - 20
+        renderer = LevelRenderer(self.dicts, level[0], width, height)
+        return renderer, MirroredRenderer(renderer, level[1])
+
+    def solo_renderer(self):
+        """renderer of the solo board, rebuilt when the board or its map changes"""
+        width, height = self.window_width - 20, self.window_height - 20
+        if self.renderer is None or not self.renderer.is_current(self.level[0], width, height):
+            self.renderer = LevelRenderer(self.dicts, self.level[0], width, height)
+        return self.renderer
 
-    @staticmethod
-    def resize_surface(map_surface, background_width, background_height):
-        """in particular allows the double board surface to be matched to the screen size"""
-        surface_width = map_surface.get_width()
-        surface_height = map_surface.get_height()
-        if surface_height > background_height:
-            surface_width = surface_width * background_height / surface_height
-            surface_height = background_height
-            map_surface = pygame.transform.scale(map_surface,
-                                                 (surface_width, surface_height))
-        if surface_width > background_width:
-            surface_height = surface_height * background_width / surface_width
-            surface_width = background_width
-            map_surface = pygame.transform.scale(map_surface,
-                                                 (surface_width, surface_height))
-        return map_surface
+    def draw_level(self, level, background_width, background_height):
+        """draws level from the board, with tiles scaled to fit the background"""
+        return LevelRenderer(self.dicts, level, background_width, background_height).draw()
 
     def redraw_solo_level(self, direction):
         """reaction to the direction keys"""
-        self.level[0].step(KEYS[direction])
-        return self.display_solo_game()
+        level = self.level[0]
+        if self.render_mode != "incremental" or self.renderer is None:
+            level.step(KEYS[direction])
+            return self.display_solo_game()
+
+        previous = level.player
+        if not level.step(KEYS[direction]):
+            return self.loop("solo")
+        return self.update_solo_level(previous)
+
+    def update_solo_level(self, previous):
+        """repaints the solo board after the player moved or was moved back from previous"""
+        level = self.level[0]
+        if level.is_finished() or not self.renderer.is_current(
+                level, self.window_width - 20, self.window_height - 20):
+            return self.display_solo_game()
+
+        pygame.display.update(self.renderer.update(self.surface_display,
+                                                   self.moved_tiles(previous)))
+        return self.loop("solo")
+
+    def moved_tiles(self, previous, level=None):
+        """tiles a single move or undone move from previous changed, on the solo board
+        unless another level is given"""
+        level = level or self.level[0]
+        # a box pushed by the move lies beyond the player, one pulled back by an undo
+        # lies beyond the previous position
+        player = level.player
+        direction = (player[0] - previous[0], player[1] - previous[1])
+        return [previous, player, level.move(player, direction),
+                level.move(previous, (-direction[0], -direction[1]))]
+
+    def mouse_tile(self):
+        """tile of the solo board under the mouse event that woke the loop"""
+        if self.level is None or not hasattr(self.event, "pos"):
+            return None
+        renderer = self.solo_renderer()
+        if self.render_mode != "incremental":
+            # the full redraw is centred the same way as the renderer's own drawing
+            renderer.rectangle.center = (self.window_width/2, self.window_height/2)
+        return renderer.tile_at(self.event.pos)
+
+    def grab_tile(self):
+        """remembers the tile where a mouse button went down"""
+        self.grabbed = self.mouse_tile()
+        return self.loop("solo")
+
+    def drop_tile(self):
+        """walks to a clicked tile, or pushes a star dragged from one tile to another"""
+        grabbed, self.grabbed = self.grabbed, None
+        target = self.mouse_tile()
+        level = self.level[0]
+        if grabbed is None or target is None:
+            return self.loop("solo")
+        if grabbed != target and level.has_box(grabbed):
+            path = level.push_path(grabbed, target)
+        else:
+            path = level.walk_path(target)
+        if not path:
+            return self.loop("solo")
+        return self.follow_path(path)
+
+    def follow_path(self, path):
+        """makes the moves of a path, repainting only the tiles they change, step by step
+        at walk_speed or all at once; a key or click during a walk stops it and is
+        handled by the loop"""
+        level = self.level[0]
+        incremental = self.render_mode == "incremental" and self.renderer.is_current(
+            level, self.window_width - 20, self.window_height - 20)
+        dirty_rectangles = []
+        for direction in path:
+            previous = level.player
+            if not level.step(direction):
+                break
+            if incremental and not level.is_finished():
+                dirty_rectangles += self.renderer.update(self.surface_display,
+                                                         self.moved_tiles(previous))
+                if self.walk_speed:
+                    pygame.display.update(dirty_rectangles)
+                    dirty_rectangles = []
+                    self.clock.tick(self.walk_speed)
+                    if self.input_waiting():
+                        break
+        if not incremental or level.is_finished():
+            return self.display_solo_game()
+        pygame.display.update(dirty_rectangles)
+        return self.loop("solo")
+
+    @staticmethod
+    def input_waiting():
+        """check if input events are waiting, repainting the window if it was uncovered
+        in the meantime"""
+        if pygame.event.get(list(REDRAW_EVENTS)):
+            pygame.display.update()
+        return pygame.event.peek(list(INPUT_EVENTS))
+
+    def undo_move(self):
+        """takes back the last move of the solo game"""
+        return self.change_solo_move(self.level[0].undo)
+
+    def redo_move(self):
+        """makes the last undone move of the solo game again"""
+        return self.change_solo_move(self.level[0].redo)
+
+    def change_solo_move(self, change):
+        """undoes or redoes a move of the solo board and repaints what it changed"""
+        if self.mode != "solo":
+            return self.loop(self.mode)
+        previous = self.level[0].player
+        if not change():
+            return self.loop("solo")
+        if self.render_mode != "incremental" or self.renderer is None:
+            return self.display_solo_game()
+        return self.update_solo_level(previous)
+
+    def restart_level(self):
+        """undoes all moves of the solo game, they can be redone afterwards"""
+        if self.mode == "solo":
+            self.level[0].restart()
+            return self.display_solo_game()
+        return self.loop(self.mode)
 
     def redraw_dual_level(self, direction):
-        """reaction to the direction keys"""
-        if direction.endswith("A"):
-            self.level[1].step(KEYS[direction])
-        elif direction.endswith("B"):
-            self.level[0].step(KEYS[direction])
-        return self.display_dual_game()
+        """reaction to the direction keys, only the half of the player who moved is
+        repainted"""
+        half = 1 if direction.endswith("A") else 0
+        level = self.level[half]
+        if self.render_mode != "incremental" or self.dual_renderers is None:
+            level.step(KEYS[direction])
+            return self.display_dual_game()
+
+        previous = level.player
+        if not level.step(KEYS[direction]):
+            return self.loop("dual")
+        renderer = self.dual_renderers[half]
+        if level.is_finished() or not renderer.is_current(
+                level, (self.window_width - 30) // 2, self.window_height - 20):
+            return self.display_dual_game()
+        pygame.display.update(renderer.update(self.surface_display,
+                                              self.moved_tiles(previous, level)))
+        return self.loop("dual")